@@ -0,0 +1,254 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import AnonymousUser
+from django.core.paginator import Page
+from django.db import close_old_connections
+from django.db.models import Count, Prefetch, prefetch_related_objects
+from django.http import HttpResponse
+from django.urls import URLPattern
+from django.utils.cache import patch_vary_headers
+from rest_framework.exceptions import AuthenticationFailed, NotFound
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+
+from .authentication import CachedTokenAuthentication
+from .caching import (conditional_validators, overlay_user_flags,
+                      recipe_bodies, set_validators)
+from .constants import (PAGINATION_QUERY_PARAM, CURSOR_PAGINATION,
+                        RECIPE_VERSION, REFERENCE_VERSION, USER_VERSION,
+                        TAGS_VERSION, INGREDIENTS_VERSION)
+from .filters import RecipeFilter
+from .paginations import CachedCountPagination, CachedCountPaginator
+from .reference import reference
+from .serializers import IngredientSerializer, SubscriptionSerializer
+from recipes.models import Best, Recipe, ShopCart, User
+from users.models import Follow
+
+
+def _query(function, *args):
+    """
+    Синхронный вызов ORM в отдельном потоке.
+    Независимые запросы одного ответа так выполняются параллельно.
+    """
+    def run():
+        try:
+            return function(*args)
+        finally:
+            close_old_connections()
+    return sync_to_async(run, thread_sensitive=False)()
+
+
+def _authenticate(request):
+    try:
+        result = CachedTokenAuthentication().authenticate(request)
+    except AuthenticationFailed:
+        return None
+    return result[0] if result else AnonymousUser()
+
+
+def _accepts_json(request):
+    return ('format' not in request.GET
+            and 'text/html' not in request.META.get('HTTP_ACCEPT', ''))
+
+
+def _json_response(data=None, content=None, status=200):
+    if content is None:
+        content = JSONRenderer().render(data)
+    response = HttpResponse(content, content_type='application/json',
+                            status=status)
+    patch_vary_headers(response, ('Accept',))
+    return response
+
+
+def _ids(queryset, field):
+    return set(queryset.values_list(field, flat=True))
+
+
+def _page_params(request):
+    """ Размер и номер страницы, None — если номер не число больше нуля. """
+    drf_request = Request(request)
+    page_size = CachedCountPagination().get_page_size(drf_request)
+    try:
+        number = int(request.GET.get('page', 1))
+    except ValueError:
+        return drf_request, page_size, None
+    return drf_request, page_size, number if number > 0 else None
+
+
+def _paginated(drf_request, rows, number, paginator, results):
+    pagination = CachedCountPagination()
+    pagination.request = drf_request
+    pagination.page = Page(rows, number, paginator)
+    return pagination.get_paginated_response(results).data
+
+
+def _page_exists(number, paginator):
+    return number <= paginator.num_pages or number == 1
+
+
+async def recipe_list(request, sync_view, *args, **kwargs):
+    user = await _query(_authenticate, request)
+    if (user is None or not user.is_authenticated
+            or request.GET.get(PAGINATION_QUERY_PARAM) == CURSOR_PAGINATION):
+        return await sync_view(request, *args, **kwargs)
+    request.user = user
+    filterset = RecipeFilter(request.GET, request=request,
+                             queryset=Recipe.objects.select_related('author'))
+    drf_request, page_size, number = _page_params(request)
+    if number is None or not await _query(filterset.is_valid):
+        return await sync_view(request, *args, **kwargs)
+    queryset = filterset.qs
+    paginator = CachedCountPaginator(queryset, page_size)
+    offset = (number - 1) * page_size
+    rows, _, favorited, in_cart, subscribed = await asyncio.gather(
+        _query(list, queryset[offset:offset + page_size]),
+        _query(getattr, paginator, 'count'),
+        _query(_ids, Best.objects.filter(user=user), 'recipe_id'),
+        _query(_ids, ShopCart.objects.filter(user=user), 'recipe_id'),
+        _query(_ids, Follow.objects.filter(user=user), 'author_id'))
+    if not _page_exists(number, paginator):
+        return await sync_view(request, *args, **kwargs)
+    bodies = await _query(recipe_bodies, rows)
+    results = [
+        overlay_user_flags(body, recipe.author_id in subscribed,
+                           recipe.pk in favorited, recipe.pk in in_cart)
+        for recipe, body in zip(rows, bodies)
+    ]
+    return _json_response(
+        _paginated(drf_request, rows, number, paginator, results))
+
+
+async def recipe_detail(request, sync_view, *args, **kwargs):
+    user = await _query(_authenticate, request)
+    pk = kwargs['pk']
+    if user is None or not user.is_authenticated or not pk.isdigit():
+        return await sync_view(request, *args, **kwargs)
+    etag, last_modified, response = await _query(
+        conditional_validators, request,
+        (RECIPE_VERSION.format(pk), REFERENCE_VERSION,
+         USER_VERSION.format(user.pk)))
+    if response is None:
+        recipe, favorited, in_cart, subscribed = await asyncio.gather(
+            _query(Recipe.objects.select_related('author').filter(
+                pk=pk).first),
+            _query(Best.objects.filter(user=user, recipe_id=pk).exists),
+            _query(ShopCart.objects.filter(user=user, recipe_id=pk).exists),
+            _query(_ids, Follow.objects.filter(user=user), 'author_id'))
+        if recipe is None:
+            return _json_response({'detail': NotFound.default_detail},
+                                  status=NotFound.status_code)
+        body, = await _query(recipe_bodies, [recipe])
+        response = _json_response(overlay_user_flags(
+            body, recipe.author_id in subscribed, favorited, in_cart))
+    return set_validators(response, etag, last_modified)
+
+
+def _reference_view(collection, version):
+    async def list_view(request, sync_view, *args, **kwargs):
+        etag, last_modified, response = await _query(
+            conditional_validators, request, (version,))
+        if response is None:
+            data = await _query(reference.get)
+            name = request.GET.get('name')
+            if collection == 'ingredients' and name:
+                response = _json_response(IngredientSerializer(
+                    data.search_ingredients(name), many=True).data)
+            else:
+                response = _json_response(
+                    content=getattr(data, collection + '_json'))
+        return set_validators(response, etag, last_modified)
+
+    async def detail_view(request, sync_view, *args, **kwargs):
+        pk = kwargs['pk']
+        etag, last_modified, response = await _query(
+            conditional_validators, request, (version,))
+        if response is None:
+            data = await _query(reference.get)
+            item = getattr(data, collection + '_by_id').get(
+                int(pk) if pk.isdigit() else None)
+            if item is None:
+                return await sync_view(request, *args, **kwargs)
+            response = _json_response(item._asdict())
+        return set_validators(response, etag, last_modified)
+
+    return list_view, detail_view
+
+
+tag_list, tag_detail = _reference_view('tags', TAGS_VERSION)
+ingredient_list, ingredient_detail = _reference_view('ingredients',
+                                                     INGREDIENTS_VERSION)
+
+
+def _limited_recipes(authors, recipes_limit):
+    recipes = Recipe.objects.all()
+    if recipes_limit is not None:
+        recipes = Recipe.objects.latest_per_author(
+            [author.id for author in authors], recipes_limit)
+    prefetch_related_objects(authors, Prefetch('recipes', queryset=recipes,
+                                               to_attr='limited_recipes'))
+
+
+async def subscriptions(request, sync_view, *args, **kwargs):
+    user = await _query(_authenticate, request)
+    drf_request, page_size, number = _page_params(request)
+    if user is None or not user.is_authenticated or number is None:
+        return await sync_view(request, *args, **kwargs)
+    request.user = user
+    queryset = User.objects.filter(following__user=user).annotate(
+        recipes_count=Count('recipes')).order_by('username')
+    paginator = CachedCountPaginator(queryset, page_size)
+    offset = (number - 1) * page_size
+    authors, _ = await asyncio.gather(
+        _query(list, queryset[offset:offset + page_size]),
+        _query(getattr, paginator, 'count'))
+    if not _page_exists(number, paginator):
+        return await sync_view(request, *args, **kwargs)
+    await _query(_limited_recipes, authors,
+                 SubscriptionSerializer.get_recipes_limit(drf_request))
+    serializer = SubscriptionSerializer(authors, many=True, context={
+        'request': drf_request,
+        'subscribed_ids': {author.id for author in authors}})
+    return _json_response(_paginated(drf_request, authors, number,
+                                     paginator, serializer.data))
+
+
+ASYNC_HANDLERS = {
+    'recipes-list': recipe_list,
+    'recipes-detail': recipe_detail,
+    'tags-list': tag_list,
+    'tags-detail': tag_detail,
+    'ingredients-list': ingredient_list,
+    'ingredients-detail': ingredient_detail,
+    'users-subscriptions': subscriptions,
+}
+
+
+def async_read_view(handler, sync_view):
+    """
+    Асинхронная обертка для GET-эндпоинта.
+    Остальные методы, суффиксы формата, браузерный API и все
+    нестандартные случаи обрабатывает исходный синхронный view.
+    """
+    sync_view = sync_to_async(sync_view)
+
+    async def view(request, *args, **kwargs):
+        if (request.method != 'GET' or 'format' in kwargs
+                or not _accepts_json(request)):
+            return await sync_view(request, *args, **kwargs)
+        return await handler(request, sync_view, *args, **kwargs)
+
+    view.csrf_exempt = True
+    return view
+
+
+def with_async_reads(patterns):
+    """ Подмена обработчиков горячих GET-эндпоинтов роутера. """
+    return [
+        URLPattern(pattern.pattern,
+                   async_read_view(ASYNC_HANDLERS[pattern.name],
+                                   pattern.callback),
+                   pattern.default_args, pattern.name)
+        if pattern.name in ASYNC_HANDLERS else pattern
+        for pattern in patterns
+    ]
@@ -0,0 +1,59 @@
+import hashlib
+
+from django.core.cache import cache
+from django.db import router
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from .constants import (TOKEN_CACHE_KEY, TOKEN_CACHE_TIMEOUT,
+                        TOKEN_CACHE_USER_EXCLUDE, TOKEN_CACHE_TOKEN_EXCLUDE)
+from recipes.models import User
+
+
+def token_cache_key(key):
+    return TOKEN_CACHE_KEY.format(hashlib.sha256(key.encode()).hexdigest())
+
+
+def forget_tokens(*keys):
+    cache.delete_many([token_cache_key(key) for key in keys])
+
+
+def _attnames(model, exclude):
+    return [field.attname for field in model._meta.concrete_fields
+            if field.attname not in exclude]
+
+
+def _snapshot(instance, exclude=()):
+    return tuple(getattr(instance, name)
+                 for name in _attnames(type(instance), exclude))
+
+
+def _restore(model, values, exclude=()):
+    return model.from_db(router.db_for_read(model),
+                         _attnames(model, exclude), values)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    Аутентификация по токену с кешем token → пользователь.
+    В кеше лежат значения полей токена и пользователя, из них
+    собираются модели без запроса к базе. Хеш пароля и сам токен
+    в кеш не попадают: пароль остается отложенным полем. Записи
+    удаляются сигналами при выходе, смене пароля и деактивации.
+    """
+
+    def authenticate_credentials(self, key):
+        cache_key = token_cache_key(key)
+        snapshot = cache.get(cache_key)
+        if snapshot is None:
+            user, token = super().authenticate_credentials(key)
+            cache.set(cache_key, (_snapshot(user, TOKEN_CACHE_USER_EXCLUDE),
+                                  _snapshot(token, TOKEN_CACHE_TOKEN_EXCLUDE)),
+                      TOKEN_CACHE_TIMEOUT)
+            return user, token
+        user_values, token_values = snapshot
+        user = _restore(User, user_values, TOKEN_CACHE_USER_EXCLUDE)
+        token = _restore(Token, token_values, TOKEN_CACHE_TOKEN_EXCLUDE)
+        token.key = key
+        token.user = user
+        return user, token
@@ -0,0 +1,112 @@
+import hashlib
+
+from django.core.cache import cache, caches
+from django.db.models import prefetch_related_objects
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, urlencode
+from rest_framework.response import Response
+
+from .constants import (RESPONSE_CACHE_TIMEOUT, RECIPE_BODY_CACHE,
+                        RECIPE_BODY_KEY, RECIPE_BODY_TIMEOUT, RECIPE_VERSION,
+                        REFERENCE_VERSION)
+from .serializers import RecipeRetriveSerializer, UserSerializer
+from .versions import get_versions
+from recipes.models import Recipe
+
+
+def conditional_validators(request, names):
+    """
+    ETag и Last-Modified по версиям данных, без обращения к базе.
+    Третьим значением идет ответ 304, если копия клиента актуальна.
+    """
+    versions = get_versions(*names)
+    etag = '"{}"'.format(hashlib.md5(
+        repr(list(zip(names, versions))).encode()).hexdigest())
+    last_modified = max(versions) // 1000
+    return etag, last_modified, get_conditional_response(
+        request, etag=etag, last_modified=last_modified)
+
+
+def set_validators(response, etag, last_modified):
+    if response.status_code in (200, 304):
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        patch_vary_headers(response, ('Authorization',))
+    return response
+
+
+def conditional_response(request, names, view, *args, **kwargs):
+    """ Условный GET: совпавший If-None-Match дает 304 до вызова view. """
+    etag, last_modified, response = conditional_validators(request, names)
+    if response is None:
+        response = view(request, *args, **kwargs)
+    return set_validators(response, etag, last_modified)
+
+
+def response_cache_key(request, versions):
+    query = urlencode(sorted((key, sorted(values)) for key, values
+                             in request.query_params.lists()), doseq=True)
+    raw = f'{request.path}?{query}#{":".join(map(str, versions))}'
+    return 'response:' + hashlib.md5(raw.encode()).hexdigest()
+
+
+def cached_response(request, versions, view, *args, **kwargs):
+    """
+    Данные ответа view из кеша для анонимных запросов.
+    Ключ включает версии данных, поэтому изменения сбрасывают кеш.
+    """
+    key = response_cache_key(request, versions)
+    data = cache.get(key)
+    if data is not None:
+        return Response(data)
+    response = view(request, *args, **kwargs)
+    if response.status_code == 200:
+        cache.set(key, response.data, RESPONSE_CACHE_TIMEOUT)
+    return response
+
+
+def recipe_bodies(recipes):
+    """
+    Не зависящие от пользователя представления рецептов.
+    Берутся из кеша по версии рецепта, промахи сериализуются пачкой.
+    """
+    *versions, reference = get_versions(
+        *(RECIPE_VERSION.format(recipe.pk) for recipe in recipes),
+        REFERENCE_VERSION)
+    keys = {recipe.pk: RECIPE_BODY_KEY.format(recipe.pk, version, reference)
+            for recipe, version in zip(recipes, versions)}
+    body_cache = caches[RECIPE_BODY_CACHE]
+    bodies = body_cache.get_many(keys.values())
+    missing = [recipe for recipe in recipes if keys[recipe.pk] not in bodies]
+    if missing:
+        prefetch_related_objects(missing,
+                                 *Recipe.objects.related_lookups())
+        serialized = {
+            keys[recipe.pk]: body for recipe, body in zip(
+                missing, RecipeRetriveSerializer(missing, many=True).data)
+        }
+        body_cache.set_many(serialized, RECIPE_BODY_TIMEOUT)
+        bodies.update(serialized)
+    return [bodies[keys[recipe.pk]] for recipe in recipes]
+
+
+def serialize_recipes(recipes, context):
+    """
+    Рецепты для авторизованного пользователя: кешированные тела
+    с наложенными is_favorited, is_in_shopping_cart и is_subscribed.
+    Флаги берутся из аннотаций выборки и подписок пользователя.
+    """
+    subscribed_ids = UserSerializer(context=context).get_subscribed_ids()
+    return [
+        overlay_user_flags(body, recipe.author_id in subscribed_ids,
+                           recipe.is_favorited, recipe.is_in_shopping_cart)
+        for recipe, body in zip(recipes, recipe_bodies(recipes))
+    ]
+
+
+def overlay_user_flags(body, is_subscribed, is_favorited,
+                       is_in_shopping_cart):
+    return {**body,
+            'author': {**body['author'], 'is_subscribed': is_subscribed},
+            'is_favorited': is_favorited,
+            'is_in_shopping_cart': is_in_shopping_cart}
@@ -1,6 +1,7 @@
 NO_INGREDIENTS_ERROR = 'Ни один ингридиент не указан'
 NO_TAGS_ERROR = 'Ни один тег не указан'
-NOT_EXIST_INGREDIENT_ERROR = 'Несуществующий ингредиент'
+NOT_EXIST_INGREDIENT_ERROR = 'Несуществующие ингредиенты: {}'
+NOT_EXIST_TAG_ERROR = 'Несуществующие теги: {}'
 DUPLICATE_INGREDIENT_ERROR = 'Введен повторяющийся ингредиент'
 DUPLICATE_TAG_ERROR = 'Введен повторяющийся тег'
 DULICATE_FOLLOW_ERROR = 'Вы уже подписаны на этого пользователя'
@@ -18,9 +19,53 @@ NO_IMAGE_FIELD = 'Нет поля с изображением'
 MAX_VALUE_ERROR = 'Превышено максимальное значение {}'
 MIN_VALUE_ERROR = 'Значение ме может быть меньше {}'
 
+IMAGE_DECODE_CHUNK_SIZE = 64 * 1024
+IMAGE_HEAD_SIZE = 512
+RECIPE_RENDITIONS = (('image_preview', 960), ('image_thumbnail', 320))
+RENDITION_FORMAT = 'webp'
+RENDITION_QUALITY = 80
+
 SHOP_LIST_TITLE = 'СПИСОК ПОКУПОК'
 SHOP_LIST_HEAD = 'ПРОДУКТОВЫЙ ПОМОЩНИК. Страница '
 SHOP_LIST_ITEMS_PER_PAGE = 30
+SHOP_LIST_SPOOL_MAX_SIZE = 512 * 1024
+SHOP_LIST_IMAGE = 'shop_cart.png'
+SHOP_LIST_IMAGE_SIZE = 200
+SHOP_LIST_HEADER_FORM = 'shop_list_header'
+SHOP_LIST_FILENAME = 'shop_cart'
+SHOP_LIST_CSV_HEADER = ('name', 'measurement_unit', 'amount')
+SHOP_LIST_CACHE = 'shopping_lists'
+SHOP_LIST_CACHE_MAX_SIZE = 2 * 1024 * 1024
 
 AMOUNT_MIN_VALUE = 1
 AMOUNT_MAX_VALUE = 2147483647
+
+INGREDIENT_SEARCH_LIMIT = 50
+
+PAGINATION_QUERY_PARAM = 'pagination'
+CURSOR_PAGINATION = 'cursor'
+COUNT_CACHE_TIMEOUT = 60
+COUNT_ESTIMATE_THRESHOLD = 10000
+
+RESPONSE_CACHE_TIMEOUT = 5 * 60
+RECIPES_VERSION = 'recipes'
+RECIPE_VERSION = 'recipe:{}'
+REFERENCE_VERSION = 'reference'
+TAGS_VERSION = 'tags'
+INGREDIENTS_VERSION = 'ingredients'
+USER_VERSION = 'user:{}'
+AUTHOR_FIELDS = ('username', 'first_name', 'last_name', 'email')
+TABLE_VERSION = 'table:{}'
+RECIPE_BODY_CACHE = 'recipe_bodies'
+RECIPE_BODY_KEY = 'recipe_body:{}:{}:{}'
+RECIPE_BODY_TIMEOUT = 60 * 60
+TOKEN_CACHE_KEY = 'auth_token:{}'
+TOKEN_CACHE_TIMEOUT = 5 * 60
+TOKEN_CACHE_USER_EXCLUDE = ('password',)
+TOKEN_CACHE_TOKEN_EXCLUDE = ('key',)
+
+METRICS_PREFIX = 'foodgramm_'
+METRICS_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5,
+                           5)
+UNRESOLVED_ROUTE = 'unresolved'
+QUERY_BUDGET_EXCEEDED = '{} {}: {} SQL-запросов при бюджете {}'
@@ -1,6 +1,8 @@
 import django_filters as filters
+from django_filters.widgets import BooleanWidget
 
-from recipes.models import Ingredient, Recipe, Tag
+from .reference import reference
+from recipes.models import Ingredient, Recipe
 
 
 class IngredientFilter(filters.FilterSet):
@@ -19,14 +21,29 @@ class IngredientFilter(filters.FilterSet):
 class RecipeFilter(filters.FilterSet):
     """ Фильтр рецептов по тегам и автору. """
 
-    tags = filters.ModelMultipleChoiceFilter(
+    tags = filters.MultipleChoiceFilter(
         field_name='tags__slug',
-        to_field_name='slug',
-        queryset=Tag.objects.all())
-    is_favorited = filters.CharFilter(field_name='is_favorited')
-    is_in_shopping_cart = filters.CharFilter(
-        field_name='is_in_shopping_cart')
+        choices=lambda: reference.get().tag_choices())
+    is_favorited = filters.BooleanFilter(method='filter_is_favorited',
+                                         widget=BooleanWidget())
+    is_in_shopping_cart = filters.BooleanFilter(
+        method='filter_is_in_shopping_cart', widget=BooleanWidget())
 
     class Meta:
         model = Recipe
         fields = ('author',)
+
+    def filter_by_user(self, queryset, lookup, value):
+        """ Полусоединение с избранным или корзиной текущего пользователя. """
+        user = self.request.user
+        if not user.is_authenticated:
+            return queryset.none() if value else queryset
+        if value:
+            return queryset.filter(**{lookup: user})
+        return queryset.exclude(**{lookup: user})
+
+    def filter_is_favorited(self, queryset, name, value):
+        return self.filter_by_user(queryset, 'best_set__user', value)
+
+    def filter_is_in_shopping_cart(self, queryset, name, value):
+        return self.filter_by_user(queryset, 'shopcart_set__user', value)
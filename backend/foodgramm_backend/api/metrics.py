@@ -0,0 +1,260 @@
+import asyncio
+import logging
+from bisect import bisect_left
+from contextvars import ContextVar
+from threading import Lock
+from time import perf_counter
+
+from asgiref.sync import markcoroutinefunction
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from rest_framework.serializers import BaseSerializer
+
+from .constants import (METRICS_LATENCY_BUCKETS, METRICS_PREFIX,
+                        QUERY_BUDGET_EXCEEDED, UNRESOLVED_ROUTE)
+from foodgramm_backend.postgresql.pool import pool_stats
+
+logger = logging.getLogger(__name__)
+
+_current = ContextVar('request_metrics', default=None)
+
+
+class QueryBudgetExceeded(Exception):
+    """ Запрос выполнил больше SQL-запросов, чем разрешено для маршрута. """
+
+
+class RequestMetrics:
+    """ Счетчики одного HTTP-запроса. """
+
+    def __init__(self):
+        self.lock = Lock()
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.serializing = False
+        self.serialize_seconds = 0.0
+        self.render_start = None
+        self.render_seconds = 0.0
+
+    def rendered(self, response):
+        if self.render_start is not None:
+            self.render_seconds = perf_counter() - self.render_start
+
+
+def record_query(execute, sql, params, many, context):
+    """
+    Обертка выполнения SQL: число запросов и время в базе.
+    Запросы вне HTTP-запроса не учитываются.
+    """
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    start = perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = perf_counter() - start
+        with metrics.lock:
+            metrics.queries += 1
+            metrics.db_seconds += elapsed
+
+
+def instrument_serializers():
+    """
+    Время вычисления serializer.data внутри запроса. Вложенные вызовы
+    .data из методов сериализаторов входят во время внешнего вызова,
+    SQL-запросы ленивых выборок учитываются и здесь, и во времени базы.
+    """
+    data = BaseSerializer.data.fget
+    if getattr(data, 'measured', False):
+        return
+
+    def measured_data(serializer):
+        metrics = _current.get()
+        if metrics is None or metrics.serializing:
+            return data(serializer)
+        metrics.serializing = True
+        start = perf_counter()
+        try:
+            return data(serializer)
+        finally:
+            metrics.serialize_seconds += perf_counter() - start
+            metrics.serializing = False
+
+    measured_data.measured = True
+    BaseSerializer.data = property(measured_data)
+
+
+class RouteStats:
+    def __init__(self):
+        self.requests = 0
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.serialize_seconds = 0.0
+        self.render_seconds = 0.0
+        self.seconds = 0.0
+        self.budget_exceeded = 0
+        self.buckets = [0] * len(METRICS_LATENCY_BUCKETS)
+
+
+class MetricsRegistry:
+    """ Накопленные показатели процесса по именам маршрутов. """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._routes = {}
+
+    def observe(self, route, method, metrics, seconds, budget_exceeded):
+        with self._lock:
+            stats = self._routes.setdefault((route, method), RouteStats())
+            stats.requests += 1
+            stats.queries += metrics.queries
+            stats.db_seconds += metrics.db_seconds
+            stats.serialize_seconds += metrics.serialize_seconds
+            stats.render_seconds += metrics.render_seconds
+            stats.seconds += seconds
+            stats.budget_exceeded += budget_exceeded
+            position = bisect_left(METRICS_LATENCY_BUCKETS, seconds)
+            if position < len(stats.buckets):
+                stats.buckets[position] += 1
+
+    def render(self):
+        """ Показатели в текстовом формате Prometheus. """
+        with self._lock:
+            routes = [(f'route="{route}",method="{method}"', stats)
+                      for (route, method), stats
+                      in sorted(self._routes.items())]
+            lines = []
+            for name, kind, help_text, value in (
+                ('requests_total', 'counter', 'Обработано запросов',
+                 lambda stats: stats.requests),
+                ('db_queries_total', 'counter', 'Выполнено SQL-запросов',
+                 lambda stats: stats.queries),
+                ('db_seconds_total', 'counter', 'Время в базе данных',
+                 lambda stats: stats.db_seconds),
+                ('serialize_seconds_total', 'counter',
+                 'Время вычисления serializer.data',
+                 lambda stats: stats.serialize_seconds),
+                ('render_seconds_total', 'counter',
+                 'Время рендеринга ответа рендерером',
+                 lambda stats: stats.render_seconds),
+                ('query_budget_exceeded_total', 'counter',
+                 'Превышений бюджета SQL-запросов',
+                 lambda stats: stats.budget_exceeded),
+            ):
+                lines += [f'# HELP {METRICS_PREFIX}{name} {help_text}',
+                          f'# TYPE {METRICS_PREFIX}{name} {kind}']
+                lines += [f'{METRICS_PREFIX}{name}{{{labels}}} '
+                          f'{value(stats)}' for labels, stats in routes]
+            name = f'{METRICS_PREFIX}request_duration_seconds'
+            lines += [f'# HELP {name} Время обработки запроса',
+                      f'# TYPE {name} histogram']
+            for labels, stats in routes:
+                total = 0
+                for bound, count in zip(METRICS_LATENCY_BUCKETS,
+                                        stats.buckets):
+                    total += count
+                    lines.append(
+                        f'{name}_bucket{{{labels},le="{bound}"}} '
+                        f'{total}')
+                lines += [
+                    f'{name}_bucket{{{labels},le="+Inf"}} '
+                    f'{stats.requests}',
+                    f'{name}_sum{{{labels}}} {stats.seconds}',
+                    f'{name}_count{{{labels}}} {stats.requests}']
+        pools = sorted(pool_stats().items())
+        for key in ('size', 'in_use', 'idle', 'opened', 'checkouts',
+                    'timeouts', 'wait_seconds'):
+            name = f'{METRICS_PREFIX}db_pool_{key}'
+            lines.append(f'# TYPE {name} gauge')
+            lines += [f'{name}{{alias="{alias}",database="{database}"}} '
+                      f'{stats[key]}'
+                      for (alias, database), stats in pools]
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+
+class MetricsMiddleware:
+    """
+    Число SQL-запросов, время в базе, время сериализации данных,
+    время рендеринга ответа и общее время по имени маршрута и методу.
+    Значения уходят в заголовок Server-Timing и в /api/metrics.
+    Превышение бюджета из QUERY_BUDGETS (ключ «МЕТОД маршрут») пишется
+    в лог, а при QUERY_BUDGET_STRICT вызывает исключение.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        metrics, token, start = self.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics, start)
+
+    async def __acall__(self, request):
+        metrics, token, start = self.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics, start)
+
+    def process_template_response(self, request, response):
+        metrics = _current.get()
+        if metrics is not None:
+            metrics.render_start = perf_counter()
+            response.add_post_render_callback(metrics.rendered)
+        return response
+
+    @staticmethod
+    def start():
+        metrics = RequestMetrics()
+        return metrics, _current.set(metrics), perf_counter()
+
+    @staticmethod
+    def finish(request, response, metrics, start):
+        seconds = perf_counter() - start
+        match = request.resolver_match
+        route = match.view_name if match else UNRESOLVED_ROUTE
+        budget = settings.QUERY_BUDGETS.get(f'{request.method} {route}')
+        exceeded = budget is not None and metrics.queries > budget
+        registry.observe(route, request.method, metrics, seconds, exceeded)
+        response['Server-Timing'] = (
+            f'db;dur={metrics.db_seconds * 1000:.1f};'
+            f'desc="{metrics.queries} queries", '
+            f'serialize;dur={metrics.serialize_seconds * 1000:.1f}, '
+            f'render;dur={metrics.render_seconds * 1000:.1f}, '
+            f'total;dur={seconds * 1000:.1f}')
+        if exceeded:
+            message = QUERY_BUDGET_EXCEEDED.format(
+                request.method, route, metrics.queries, budget)
+            if settings.QUERY_BUDGET_STRICT:
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
+
+
+def metrics_view(request):
+    """
+    Показатели процесса для Prometheus. Доступны по токену
+    из METRICS_TOKEN или администратору с сессией; без токена
+    в настройках закрыты для всех остальных.
+    """
+    token = settings.METRICS_TOKEN
+    if not (token and request.headers.get('Authorization')
+            == f'Bearer {token}' or request.user.is_staff):
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(),
+                        content_type='text/plain; version=0.0.4; '
+                                     'charset=utf-8')
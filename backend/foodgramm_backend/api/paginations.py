@@ -1,5 +1,81 @@
-from rest_framework.pagination import PageNumberPagination
+import hashlib
+
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.core.exceptions import EmptyResultSet
+from django.db import connections
+from django.db.models import QuerySet
+from django.utils.functional import cached_property
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+from .constants import (COUNT_CACHE_TIMEOUT, COUNT_ESTIMATE_THRESHOLD,
+                        TABLE_VERSION)
+from .versions import get_versions
+
+
+class CachedCountPaginator(Paginator):
+    """
+    Паджинатор с кешированным общим количеством записей.
+    Ключ кеша — хеш SQL выборки, то есть нормализованный набор фильтров,
+    и версия таблицы, которая меняется при добавлении и удалении записей.
+    Для таблиц PostgreSQL без фильтров берется оценка планировщика.
+    """
+
+    @staticmethod
+    def estimate_count(queryset):
+        connection = connections[queryset.db]
+        if connection.vendor != 'postgresql' or queryset.query.where:
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT reltuples::bigint FROM pg_class '
+                'WHERE oid = to_regclass(%s)',
+                (queryset.model._meta.db_table,))
+            row = cursor.fetchone()
+        if row and row[0] >= COUNT_ESTIMATE_THRESHOLD:
+            return row[0]
+        return None
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not isinstance(queryset, QuerySet):
+            return len(queryset)
+        estimate = self.estimate_count(queryset)
+        if estimate is not None:
+            return estimate
+        try:
+            sql = str(queryset.order_by().values('pk').query)
+        except EmptyResultSet:
+            return 0
+        version, = get_versions(
+            TABLE_VERSION.format(queryset.model._meta.db_table))
+        key = f'count:{version}:' + hashlib.md5(sql.encode()).hexdigest()
+        count = cache.get(key)
+        if count is None:
+            count = queryset.count()
+            cache.set(key, count, COUNT_CACHE_TIMEOUT)
+        return count
 
 
 class PageWithLimitPagination(PageNumberPagination):
     page_size_query_param = 'limit'
+
+
+class CachedCountPagination(PageWithLimitPagination):
+    """ Постраничная пагинация с кешированным количеством записей. """
+
+    django_paginator_class = CachedCountPaginator
+
+
+class RecipeCursorPagination(CursorPagination):
+    """
+    Курсорная пагинация ленты рецептов по id.
+    DRF строит позицию курсора только по первому полю сортировки,
+    поэтому оно должно быть уникальным. pub_date заполняется при
+    создании, так что порядок id совпадает с порядком публикации.
+    Стоимость страницы не зависит от глубины, общее число не считается.
+    """
+
+    ordering = '-id'
+    page_size_query_param = 'limit'
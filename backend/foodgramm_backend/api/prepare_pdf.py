@@ -1,30 +1,56 @@
-import io
 import os
+from functools import lru_cache
+from tempfile import SpooledTemporaryFile
 
 from django.conf import settings
-from reportlab.pdfgen import canvas
+from PIL import Image
 from reportlab.lib.colors import red
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfgen import canvas
 
 from .constants import (SHOP_LIST_TITLE, SHOP_LIST_HEAD,
-                        SHOP_LIST_ITEMS_PER_PAGE)
+                        SHOP_LIST_ITEMS_PER_PAGE, SHOP_LIST_SPOOL_MAX_SIZE,
+                        SHOP_LIST_IMAGE, SHOP_LIST_IMAGE_SIZE,
+                        SHOP_LIST_HEADER_FORM)
+
+
+@lru_cache(maxsize=None)
+def _header_image():
+    """ Картинка шапки, декодированная и уменьшенная один раз на процесс. """
+    with Image.open(os.path.join(settings.MEDIA_ROOT,
+                                 SHOP_LIST_IMAGE)) as image:
+        return ImageReader(image.convert('RGBA').resize(
+            (SHOP_LIST_IMAGE_SIZE, SHOP_LIST_IMAGE_SIZE)))
+
+
+def _header_form_create(p):
+    """ Неизменная часть страницы, один Form XObject на документ. """
+    p.beginForm(SHOP_LIST_HEADER_FORM)
+    p.setStrokeColor(red)
+    p.setLineWidth(5)
+    p.line(66, 72, 66, p._pagesize[1] - 72)
+    p.setFont('FreeSans', 24)
+    p.drawString(108, p._pagesize[1] - 108, SHOP_LIST_TITLE)
+    p.drawImage(_header_image(), 450, p._pagesize[1] - 138,
+                width=100, height=100, mask='auto')
+    p.endForm()
 
 
 def prepare_pdf_buffer(shopping_list):
+    """
+    Формирует PDF со списком покупок во временном файле.
+    Файл остается в памяти до SHOP_LIST_SPOOL_MAX_SIZE байт,
+    затем сбрасывается на диск и отдается ответу по частям.
+    """
     def _page_create(p, page):
         p.saveState()
-        p.setStrokeColor(red)
-        p.setLineWidth(5)
-        p.line(66, 72, 66, p._pagesize[1] - 72)
-        p.setFont('FreeSans', 24)
-        p.drawString(108, p._pagesize[1] - 108, SHOP_LIST_TITLE)
+        p.doForm(SHOP_LIST_HEADER_FORM)
         p.setFont('FreeSans', 12)
         p.drawString(66, p._pagesize[1] - 42, SHOP_LIST_HEAD + f'{page}')
-        filename = os.path.join(settings.MEDIA_ROOT, 'shop_cart.png')
-        p.drawImage(filename, 450, p._pagesize[1] - 138,
-                    width=100, height=100, mask='auto')
 
-    buffer = io.BytesIO()
+    buffer = SpooledTemporaryFile(max_size=SHOP_LIST_SPOOL_MAX_SIZE)
     p = canvas.Canvas(buffer)
+    _header_form_create(p)
     page = 1
     n = 1
     _page_create(p, page)
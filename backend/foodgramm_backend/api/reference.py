@@ -0,0 +1,114 @@
+from bisect import bisect_left
+from collections import namedtuple
+from threading import Lock
+
+from rest_framework.renderers import JSONRenderer
+
+from .constants import (INGREDIENT_SEARCH_LIMIT, INGREDIENTS_VERSION,
+                        TAGS_VERSION)
+from .versions import get_versions
+from recipes.models import Ingredient, Tag
+
+TagRow = namedtuple('TagRow', ('id', 'name', 'color', 'slug'))
+IngredientRow = namedtuple('IngredientRow',
+                           ('id', 'name', 'measurement_unit'))
+COLLECTIONS = {'tags': (Tag, TagRow),
+               'ingredients': (Ingredient, IngredientRow)}
+
+
+class ReferenceData:
+    """
+    Неизменяемый снимок тегов и ингредиентов.
+    Строки хранятся кортежами, списки для API отрендерены в JSON заранее.
+    """
+
+    def __init__(self, versions, tags, ingredients):
+        self.versions = versions
+        self.tags = tags
+        self.tags_by_id = {tag.id: tag for tag in tags}
+        self.tags_by_slug = {tag.slug: tag for tag in tags}
+        self.tags_json = JSONRenderer().render(
+            [tag._asdict() for tag in tags])
+        self.ingredients = ingredients
+        self.ingredients_by_id = {
+            ingredient.id: ingredient for ingredient in ingredients}
+        self.ingredients_json = JSONRenderer().render(
+            [ingredient._asdict() for ingredient in ingredients])
+        self._index = sorted(
+            (ingredient.name.casefold(), ingredient.id, ingredient)
+            for ingredient in ingredients)
+        self._keys = [key for key, _, _ in self._index]
+
+    def in_bulk(self, collection, ids):
+        """
+        Строки справочника по списку id: сначала из снимка,
+        промахи добираются из базы одним in_bulk().
+        """
+        items = getattr(self, collection + '_by_id')
+        found = {pk: items[pk] for pk in ids if pk in items}
+        missing = set(ids) - found.keys()
+        if missing:
+            model, row = COLLECTIONS[collection]
+            found.update(
+                (pk, row(*(getattr(obj, field) for field in row._fields)))
+                for pk, obj in model.objects.in_bulk(missing).items())
+        return found
+
+    def tag_choices(self):
+        return [(tag.slug, tag.name) for tag in self.tags]
+
+    def search_ingredients(self, query, limit=INGREDIENT_SEARCH_LIMIT):
+        """
+        Ингредиенты, начинающиеся с query, затем содержащие query.
+        Регистр не учитывается, возвращается не более limit записей.
+        """
+        keys = self._keys
+        query = query.casefold()
+        result = []
+        position = bisect_left(keys, query)
+        while (position < len(keys) and len(result) < limit
+               and keys[position].startswith(query)):
+            result.append(self._index[position][2])
+            position += 1
+        if len(result) < limit:
+            for key, _, ingredient in self._index:
+                if query in key and not key.startswith(query):
+                    result.append(ingredient)
+                    if len(result) == limit:
+                        break
+        return result
+
+
+class ReferenceSnapshot:
+    """
+    Снимок справочников в памяти процесса.
+    Перед выдачей сверяется с версиями тегов и ингредиентов
+    и перечитывается из базы, если их изменили.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._data = None
+
+    @staticmethod
+    def _load(versions):
+        return ReferenceData(
+            versions,
+            tuple(TagRow(*row) for row in Tag.objects.values_list(
+                'id', 'name', 'color', 'slug')),
+            tuple(IngredientRow(*row) for row in
+                  Ingredient.objects.values_list(
+                      'id', 'name', 'measurement_unit')))
+
+    def get(self):
+        versions = tuple(get_versions(TAGS_VERSION, INGREDIENTS_VERSION))
+        data = self._data
+        if data is None or data.versions != versions:
+            with self._lock:
+                data = self._data
+                if data is None or data.versions != versions:
+                    data = self._data = self._load(versions)
+        return data
+
+
+reference = ReferenceSnapshot()
@@ -1,27 +1,113 @@
+import base64
+import binascii
+
+from django.core.files.uploadedfile import TemporaryUploadedFile
 from django.db import transaction
+from django.db.models import prefetch_related_objects
 from drf_extra_fields.fields import Base64ImageField as DRF_Base64ImageField
 from rest_framework import serializers
 from rest_framework.validators import UniqueTogetherValidator
 
 from .constants import (NO_INGREDIENTS_ERROR, NO_TAGS_ERROR,
+                        NOT_EXIST_INGREDIENT_ERROR, NOT_EXIST_TAG_ERROR,
                         NO_IMAGE_FIELD, SELF_FOLLOW_ERROR,
                         DUPLICATE_INGREDIENT_ERROR, DUPLICATE_TAG_ERROR,
                         DULICATE_FOLLOW_ERROR, ALREADY_IN,
                         AMOUNT_MAX_VALUE, AMOUNT_MIN_VALUE,
-                        MAX_VALUE_ERROR, MIN_VALUE_ERROR)
+                        MAX_VALUE_ERROR, MIN_VALUE_ERROR,
+                        IMAGE_DECODE_CHUNK_SIZE, IMAGE_HEAD_SIZE)
+from .reference import reference
+from .tasks import make_recipe_renditions, recipe_image_names, submit
 from recipes.models import (Tag, Ingredient, Recipe,
                             IngredientRecipe, User,
-                            ShopCart, Best)
+                            ShopCart, Best, ShopListItem,
+                            ShoppingListExport)
+from recipes.signals import shop_lists_synced
 from users.models import Follow
 
 
 class Base64ImageField(DRF_Base64ImageField):
-    """ Описание поля для кодорования изображения в Base64. """
+    """
+    Описание поля для кодорования изображения в Base64.
+    Данные декодируются кусками во временный файл на диске,
+    поэтому вторая копия изображения в памяти не создается.
+    """
+
+    def to_internal_value(self, base64_data):
+        if base64_data in self.EMPTY_VALUES:
+            return None
+        if not isinstance(base64_data, str):
+            raise serializers.ValidationError(self.INVALID_FILE_MESSAGE)
+        base64_data = ''.join(base64_data.rpartition(';base64,')[2].split())
+        file = TemporaryUploadedFile(self.get_file_name(None), None, 0, None)
+        try:
+            for start in range(0, len(base64_data), IMAGE_DECODE_CHUNK_SIZE):
+                file.write(base64.b64decode(
+                    base64_data[start:start + IMAGE_DECODE_CHUNK_SIZE],
+                    validate=True))
+            file.size = file.tell()
+            file.seek(0)
+            extension = self.get_file_extension(
+                file.name, file.read(IMAGE_HEAD_SIZE))
+            if extension not in self.ALLOWED_TYPES:
+                raise serializers.ValidationError(self.INVALID_TYPE_MESSAGE)
+            file.seek(0)
+            file.name = f'{file.name}.{extension}'
+            return serializers.ImageField.to_internal_value(self, file)
+        except (binascii.Error, ValueError):
+            file.close()
+            raise serializers.ValidationError(self.INVALID_FILE_MESSAGE)
+        except serializers.ValidationError:
+            file.close()
+            raise
 
     def to_representation(self, image):
         return image.url
 
 
+class RenditionImageField(serializers.Field):
+    """
+    Ссылка на уменьшенную копию фото рецепта.
+    Пока копия не готова, отдается ссылка на оригинал.
+    """
+
+    def __init__(self, rendition, **kwargs):
+        self.rendition = rendition
+        kwargs.update(source='*', read_only=True)
+        super().__init__(**kwargs)
+
+    def to_representation(self, recipe):
+        image = getattr(recipe, self.rendition) or recipe.image
+        return image.url if image else None
+
+
+class ReferenceField(serializers.PrimaryKeyRelatedField):
+    """
+    Ссылка на тег или ингредиент по id.
+    Поле проверяет только тип, сами строки справочника подставляет
+    RecipeModifySerializer.validate() одним проходом по всем id.
+    """
+
+    def __init__(self, collection, **kwargs):
+        self.collection = collection
+        super().__init__(**kwargs)
+
+    def get_queryset(self):
+        return getattr(reference.get(), self.collection)
+
+    def to_internal_value(self, data):
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            pk = int(data)
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        return pk
+
+    def to_representation(self, value):
+        return getattr(value, 'id', value)
+
+
 class UserSerializer(serializers.ModelSerializer):
     """
     Сериализатор для кастомной модели пользователя.
@@ -35,17 +121,24 @@ class UserSerializer(serializers.ModelSerializer):
         fields = ('id', 'username', 'first_name', 'last_name',
                   'email', 'is_subscribed')
 
+    def get_subscribed_ids(self):
+        """ Id авторов в подписках пользователя, один запрос на ответ. """
+        if 'subscribed_ids' not in self.context:
+            request = self.context.get('request')
+            self.context['subscribed_ids'] = (
+                set(request.user.follower.values_list('author_id', flat=True))
+                if request and request.user.is_authenticated else set())
+        return self.context['subscribed_ids']
+
     def get_is_subscribed(self, author):
-        request = self.context['request']
-        return (request and request.user.is_authenticated
-                and request.user.follower.filter(author=author).exists())
+        return author.id in self.get_subscribed_ids()
 
 
 class SubscriptionSerializer(UserSerializer):
     """ Сериализатор для получения списка подписок пользователя. """
 
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.ReadOnlyField(source='recipes.count')
+    recipes_count = serializers.SerializerMethodField()
 
     class Meta:
         model = User
@@ -54,19 +147,27 @@ class SubscriptionSerializer(UserSerializer):
         read_only_fields = ('email', 'username', 'first_name', 'last_name',
                             'is_subscribed', 'recipes', 'recipes_count')
 
+    @staticmethod
+    def get_recipes_limit(request):
+        try:
+            recipes_limit = int(request.query_params.get('recipes_limit'))
+        except (AttributeError, TypeError, ValueError):
+            return None
+        return recipes_limit if recipes_limit >= 0 else None
+
     def get_recipes(self, obj):
-        request = self.context['request']
-        recipes_limit = None
-        if request:
-            recipes_limit = request.query_params.get('recipes_limit')
-            recipes = obj.recipes.all()
-        if recipes_limit:
-            try:
-                recipes = recipes[:int(recipes_limit)]
-            except ValueError:
-                pass
+        recipes = getattr(obj, 'limited_recipes', None)
+        if recipes is None:
+            recipes_limit = self.get_recipes_limit(self.context.get('request'))
+            recipes = obj.recipes.all()[:recipes_limit]
         return RecipeLimitedSerializer(recipes, many=True).data
 
+    def get_recipes_count(self, obj):
+        recipes_count = getattr(obj, 'recipes_count', None)
+        if recipes_count is None:
+            recipes_count = obj.recipes.count()
+        return recipes_count
+
 
 class FollowSerializer(serializers.ModelSerializer):
     """ Сериализатор для обработки подписки пользователя на автора. """
@@ -109,8 +210,7 @@ class IngredientSerializer(serializers.ModelSerializer):
 class IngredientModifySerializer(serializers.ModelSerializer):
     """ Сериализатор для изменения ингредиентов. """
 
-    id = serializers.PrimaryKeyRelatedField(
-        queryset=Ingredient.objects.all())
+    id = ReferenceField('ingredients')
     amount = serializers.IntegerField(
         write_only=True,
         max_value=AMOUNT_MAX_VALUE,
@@ -139,8 +239,7 @@ class IngredientRetriveSerializer(serializers.ModelSerializer):
 class RecipeModifySerializer(serializers.ModelSerializer):
     """ Сериализатор для изменения рецептов. """
 
-    tags = serializers.PrimaryKeyRelatedField(queryset=Tag.objects.all(),
-                                              many=True)
+    tags = ReferenceField('tags', many=True)
     image = Base64ImageField()
     ingredients = IngredientModifySerializer(many=True)
     cooking_time = serializers.IntegerField(
@@ -152,13 +251,31 @@ class RecipeModifySerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Recipe
-        exclude = ('pub_date',)
+        exclude = ('pub_date', 'image_preview', 'image_thumbnail')
         read_only_fields = ('author',)
 
+    def save(self, **kwargs):
+        """
+        Новое фото сбрасывает старые копии и ставит в очередь новые,
+        файлы прежнего фото удаляет фоновая задача.
+        """
+        image_changed = 'image' in self.validated_data
+        old_names = []
+        if image_changed:
+            kwargs.update(image_preview=None, image_thumbnail=None)
+            if self.instance is not None:
+                old_names = recipe_image_names(self.instance)
+        recipe = super().save(**kwargs)
+        if image_changed:
+            self.validated_data['image'].close()
+            submit(make_recipe_renditions, recipe.pk, recipe.image.name,
+                   old_names)
+        return recipe
+
     @staticmethod
     def create_ingredientrecipe(ingredients, recipe):
         IngredientRecipe.objects.bulk_create(
-            IngredientRecipe(ingredient=ingredient.get('id'),
+            IngredientRecipe(ingredient_id=ingredient.get('id').id,
                              amount=ingredient.get('amount'),
                              recipe=recipe)
             for ingredient in ingredients
@@ -170,21 +287,52 @@ class RecipeModifySerializer(serializers.ModelSerializer):
         tags = validated_data.pop('tags')
         validated_data['author'] = self.context['request'].user
         recipe = Recipe.objects.create(**validated_data)
-        recipe.tags.set(tags)
+        recipe.tags.set(tag.id for tag in tags)
         self.create_ingredientrecipe(ingredients, recipe)
         return recipe
 
+    @staticmethod
+    def update_ingredientrecipe(ingredients, recipe):
+        """
+        Приводит состав рецепта к переданному: меняются, добавляются
+        и удаляются только отличающиеся строки.
+        """
+        new_amounts = {ingredient['id'].id: ingredient['amount']
+                       for ingredient in ingredients}
+        rows = {row.ingredient_id: row
+                for row in IngredientRecipe.objects.filter(recipe=recipe)}
+        old_amounts = {ingredient_id: row.amount
+                       for ingredient_id, row in rows.items()}
+        to_update = []
+        for ingredient_id, row in rows.items():
+            amount = new_amounts.get(ingredient_id)
+            if amount is not None and amount != row.amount:
+                row.amount = amount
+                to_update.append(row)
+        to_delete = [row.pk for ingredient_id, row in rows.items()
+                     if ingredient_id not in new_amounts]
+        with shop_lists_synced(recipe.pk):
+            if to_delete:
+                IngredientRecipe.objects.filter(pk__in=to_delete).delete()
+            IngredientRecipe.objects.bulk_update(to_update, ('amount',))
+            IngredientRecipe.objects.bulk_create(
+                IngredientRecipe(ingredient_id=ingredient_id, amount=amount,
+                                 recipe=recipe)
+                for ingredient_id, amount in new_amounts.items()
+                if ingredient_id not in rows)
+            ShopListItem.objects.change_recipe(recipe, old_amounts,
+                                               new_amounts)
+
     @transaction.atomic
     def update(self, instance, validated_data):
-        ingredients = validated_data.pop('ingredients')
-        instance.ingredients.clear()
-        self.create_ingredientrecipe(ingredients, instance)
-        tags = validated_data.pop('tags')
-        instance.tags.clear()
-        instance.tags.set(tags)
+        self.update_ingredientrecipe(validated_data.pop('ingredients'),
+                                     instance)
+        instance.tags.set(tag.id for tag in validated_data.pop('tags'))
         return super().update(instance, validated_data)
 
     def to_representation(self, instance):
+        prefetch_related_objects([instance],
+                                 *Recipe.objects.related_lookups())
         return RecipeRetriveSerializer(instance, context=self.context).data
 
     def validate(self, data):
@@ -199,6 +347,34 @@ class RecipeModifySerializer(serializers.ModelSerializer):
             raise serializers.ValidationError(DUPLICATE_INGREDIENT_ERROR)
         if len(tags) != len(set(tags)):
             raise serializers.ValidationError(DUPLICATE_TAG_ERROR)
+        return self.resolve_references(data)
+
+    def resolve_references(self, data):
+        """
+        Замена id тегов и ингредиентов строками справочника.
+        Все несуществующие id попадают в одну ошибку валидации.
+        """
+        snapshot = reference.get()
+        tags = snapshot.in_bulk('tags', data['tags'])
+        ingredients = snapshot.in_bulk(
+            'ingredients',
+            [ingredient['id'] for ingredient in data['ingredients']])
+        errors = {}
+        unknown_tags = [pk for pk in data['tags'] if pk not in tags]
+        if unknown_tags:
+            errors['tags'] = [NOT_EXIST_TAG_ERROR.format(
+                ', '.join(map(str, unknown_tags)))]
+        unknown_ingredients = [ingredient['id']
+                               for ingredient in data['ingredients']
+                               if ingredient['id'] not in ingredients]
+        if unknown_ingredients:
+            errors['ingredients'] = [NOT_EXIST_INGREDIENT_ERROR.format(
+                ', '.join(map(str, unknown_ingredients)))]
+        if errors:
+            raise serializers.ValidationError(errors)
+        data['tags'] = [tags[pk] for pk in data['tags']]
+        for ingredient in data['ingredients']:
+            ingredient['id'] = ingredients[ingredient['id']]
         return data
 
     def validate_image(self, image):
@@ -210,7 +386,7 @@ class RecipeModifySerializer(serializers.ModelSerializer):
 class RecipeRetriveSerializer(serializers.ModelSerializer):
     """ Сериализатор для чтения рецептов. """
 
-    image = Base64ImageField()
+    image = RenditionImageField('image_preview')
     tags = TagSerializer(many=True)
     author = UserSerializer(read_only=True,
                             default=serializers.CurrentUserDefault())
@@ -221,13 +397,13 @@ class RecipeRetriveSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Recipe
-        exclude = ('pub_date',)
+        exclude = ('pub_date', 'image_preview', 'image_thumbnail')
 
 
 class RecipeLimitedSerializer(serializers.ModelSerializer):
     """ Сериализатор для чтения рецептов находящихся в корзине и избранном. """
 
-    image = Base64ImageField()
+    image = RenditionImageField('image_thumbnail')
 
     class Meta:
         model = Recipe
@@ -263,3 +439,12 @@ class BestSerializer(BestShopCartSerializer):
 
     class Meta(BestShopCartSerializer.Meta):
         model = Best
+
+
+class ShoppingListExportSerializer(serializers.ModelSerializer):
+    """ Сериализатор для заданий на выгрузку списка покупок. """
+
+    class Meta:
+        model = ShoppingListExport
+        fields = ('id', 'format', 'status', 'created')
+        read_only_fields = ('status', 'created')
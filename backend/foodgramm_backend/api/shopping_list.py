@@ -0,0 +1,105 @@
+import csv
+import hashlib
+import io
+import json
+
+from django.core.cache import caches
+from django.http import StreamingHttpResponse
+
+from .constants import (SHOP_LIST_CACHE, SHOP_LIST_CACHE_MAX_SIZE,
+                        SHOP_LIST_CSV_HEADER, SHOP_LIST_FILENAME)
+from .prepare_pdf import prepare_pdf_buffer
+from recipes.models import ShopListItem
+
+
+class Echo:
+    """ Псевдобуфер для csv.writer: возвращает строку вместо записи. """
+
+    def write(self, value):
+        return value
+
+
+def shopping_list_queryset(user):
+    """ Суммарное количество ингредиентов из корзины пользователя. """
+    return ShopListItem.objects.filter(user=user).values(
+        'ingredient__name', 'ingredient__measurement_unit',
+        'amount').order_by('ingredient__name')
+
+
+def shopping_list_etag(shopping_list):
+    """ ETag по содержимому списка: одинаковые корзины дают один хеш. """
+    digest = hashlib.sha256(json.dumps(
+        [(elem['ingredient__name'], elem['ingredient__measurement_unit'],
+          elem['amount']) for elem in shopping_list],
+        ensure_ascii=False).encode())
+    return f'"{digest.hexdigest()}"'
+
+
+def shopping_list_pdf(shopping_list, etag):
+    """
+    PDF для списка покупок из кеша, а при промахе — свежий рендер.
+    Небольшие документы сохраняются в кеш по ETag.
+    """
+    cache = caches[SHOP_LIST_CACHE]
+    pdf = cache.get(etag)
+    if pdf is not None:
+        return io.BytesIO(pdf)
+    buffer = prepare_pdf_buffer(shopping_list)
+    buffer.seek(0, io.SEEK_END)
+    if buffer.tell() <= SHOP_LIST_CACHE_MAX_SIZE:
+        buffer.seek(0)
+        cache.set(etag, buffer.read())
+    buffer.seek(0)
+    return buffer
+
+
+def _text_lines(shopping_list):
+    for number, elem in enumerate(shopping_list, 1):
+        yield (f'{number}. {elem["ingredient__name"]} - {elem["amount"]} '
+               f'{elem["ingredient__measurement_unit"]}\n')
+
+
+def _csv_lines(shopping_list):
+    writer = csv.writer(Echo())
+    yield writer.writerow(SHOP_LIST_CSV_HEADER)
+    for elem in shopping_list:
+        yield writer.writerow((elem['ingredient__name'],
+                               elem['ingredient__measurement_unit'],
+                               elem['amount']))
+
+
+def _json_chunks(shopping_list):
+    yield '['
+    for number, elem in enumerate(shopping_list):
+        yield (',' if number else '') + json.dumps(
+            {'name': elem['ingredient__name'],
+             'measurement_unit': elem['ingredient__measurement_unit'],
+             'amount': elem['amount']},
+            ensure_ascii=False)
+    yield ']'
+
+
+SHOPPING_LIST_STREAMS = {
+    'txt': _text_lines,
+    'csv': _csv_lines,
+    'json': _json_chunks,
+}
+
+
+def shopping_list_stream(shopping_list, renderer):
+    """ Потоковый ответ со списком покупок в текстовом формате. """
+    response = StreamingHttpResponse(
+        SHOPPING_LIST_STREAMS[renderer.format](shopping_list),
+        content_type=f'{renderer.media_type}; charset=utf-8')
+    if renderer.format != 'json':
+        response['Content-Disposition'] = (
+            f'attachment; filename="{SHOP_LIST_FILENAME}.{renderer.format}"')
+    return response
+
+
+def shopping_list_file(shopping_list, format):
+    """ Готовый файл со списком покупок для фоновой выгрузки. """
+    if format in SHOPPING_LIST_STREAMS:
+        return io.BytesIO(''.join(
+            SHOPPING_LIST_STREAMS[format](shopping_list)).encode())
+    return prepare_pdf_buffer(shopping_list)
@@ -0,0 +1,136 @@
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_save)
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from .authentication import forget_tokens
+from .constants import (RECIPES_VERSION, RECIPE_VERSION, REFERENCE_VERSION,
+                        TABLE_VERSION, TAGS_VERSION, INGREDIENTS_VERSION,
+                        USER_VERSION, AUTHOR_FIELDS)
+from .metrics import record_query
+from .versions import bump_versions
+from recipes.models import (Best, Ingredient, IngredientRecipe, Recipe,
+                            ShopCart, Tag, User)
+from users.models import Follow
+
+COUNTED_TABLES = {
+    Recipe: Recipe,
+    Best: Recipe,
+    ShopCart: Recipe,
+    Follow: User,
+    User: User,
+}
+
+
+def bump_on_commit(*names):
+    transaction.on_commit(lambda: bump_versions(*names))
+
+
+def table_version(model):
+    return TABLE_VERSION.format(model._meta.db_table)
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def table_rows_changed(sender, created=True, **kwargs):
+    if created and sender in COUNTED_TABLES:
+        bump_on_commit(table_version(COUNTED_TABLES[sender]))
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def recipe_changed(instance, **kwargs):
+    bump_on_commit(RECIPES_VERSION, RECIPE_VERSION.format(instance.pk))
+
+
+@receiver((post_save, post_delete), sender=IngredientRecipe)
+def ingredient_recipe_changed(instance, **kwargs):
+    bump_on_commit(RECIPES_VERSION,
+                   RECIPE_VERSION.format(instance.recipe_id))
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def recipe_relations_changed(instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        bump_on_commit(RECIPES_VERSION, RECIPE_VERSION.format(instance.pk),
+                       table_version(Recipe))
+    elif pk_set:
+        bump_on_commit(RECIPES_VERSION, table_version(Recipe),
+                       *(RECIPE_VERSION.format(pk) for pk in pk_set))
+    else:
+        bump_on_commit(RECIPES_VERSION, REFERENCE_VERSION,
+                       table_version(Recipe))
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def tag_changed(**kwargs):
+    bump_on_commit(RECIPES_VERSION, REFERENCE_VERSION, TAGS_VERSION)
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def ingredient_changed(**kwargs):
+    bump_on_commit(RECIPES_VERSION, REFERENCE_VERSION, INGREDIENTS_VERSION)
+
+
+@receiver((post_save, post_delete), sender=Best)
+@receiver((post_save, post_delete), sender=ShopCart)
+@receiver((post_save, post_delete), sender=Follow)
+def user_flags_changed(instance, **kwargs):
+    bump_on_commit(USER_VERSION.format(instance.user_id))
+
+
+def author_fields(user):
+    return tuple(getattr(user, field) for field in AUTHOR_FIELDS)
+
+
+@receiver(pre_save, sender=User)
+def remember_author_fields(instance, raw=False, update_fields=None,
+                           **kwargs):
+    instance._author_fields = None
+    if (raw or instance._state.adding
+            or update_fields and not set(update_fields) & set(AUTHOR_FIELDS)):
+        return
+    instance._author_fields = User.objects.filter(
+        pk=instance.pk).values_list(*AUTHOR_FIELDS).first()
+
+
+@receiver(post_save, sender=User)
+def author_changed(instance, created, **kwargs):
+    """
+    Смена отображаемых полей автора сбрасывает только его рецепты.
+    Регистрация и правки пользователей без рецептов кеш не трогают,
+    удаление автора сбрасывает версии через каскад рецептов.
+    """
+    previous = getattr(instance, '_author_fields', None)
+    if created or previous is None or previous == author_fields(instance):
+        return
+    recipe_ids = list(instance.recipes.values_list('id', flat=True))
+    if recipe_ids:
+        bump_on_commit(RECIPES_VERSION, *(RECIPE_VERSION.format(pk)
+                                          for pk in recipe_ids))
+
+
+@receiver(post_save, sender=User)
+def forget_user_tokens(instance, created, **kwargs):
+    if created:
+        return
+    keys = list(Token.objects.filter(user=instance).values_list(
+        'key', flat=True))
+    if keys:
+        transaction.on_commit(lambda: forget_tokens(*keys))
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(instance, **kwargs):
+    key = instance.key
+    transaction.on_commit(lambda: forget_tokens(key))
+
+
+@receiver(connection_created)
+def instrument_connection(connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
@@ -0,0 +1,114 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from pathlib import Path
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from PIL import Image, ImageOps
+
+from .constants import (SHOP_LIST_FILENAME, RECIPE_RENDITIONS,
+                        RENDITION_FORMAT, RENDITION_QUALITY,
+                        RECIPES_VERSION, RECIPE_VERSION)
+from .shopping_list import shopping_list_file, shopping_list_queryset
+from .versions import bump_versions
+from recipes.models import Recipe, ShoppingListExport
+
+logger = logging.getLogger(__name__)
+
+executor = ThreadPoolExecutor(max_workers=settings.BACKGROUND_WORKERS,
+                              thread_name_prefix='foodgramm-worker')
+
+
+def _run(function, *args):
+    try:
+        function(*args)
+    except Exception:
+        logger.exception('Фоновая задача %s завершилась ошибкой',
+                         function.__name__)
+    finally:
+        connection.close()
+
+
+def submit(function, *args):
+    """ Запуск функции в пуле фоновых потоков после коммита транзакции. """
+    transaction.on_commit(lambda: executor.submit(_run, function, *args))
+
+
+def export_shopping_list(export_id):
+    export = ShoppingListExport.objects.select_related('user').get(
+        pk=export_id)
+    try:
+        shopping_list = shopping_list_queryset(export.user).iterator()
+        with shopping_list_file(shopping_list, export.format) as file:
+            export.file.save(
+                f'{SHOP_LIST_FILENAME}_{export.pk}.{export.format}',
+                File(file), save=False)
+        export.status = ShoppingListExport.Status.DONE
+    except Exception:
+        export.status = ShoppingListExport.Status.FAILED
+        raise
+    finally:
+        export.save(update_fields=('file', 'status'))
+
+
+def recipe_image_names(recipe):
+    """ Имена файлов фото рецепта и его уменьшенных копий. """
+    return [getattr(recipe, field).name
+            for field in ('image', *dict(RECIPE_RENDITIONS))
+            if getattr(recipe, field)]
+
+
+def _delete_unused_images(recipe_id, names):
+    """ Удаление файлов, на которые рецепт больше не ссылается. """
+    recipe = Recipe.objects.only(
+        'image', *dict(RECIPE_RENDITIONS)).filter(pk=recipe_id).first()
+    used = set(recipe_image_names(recipe)) if recipe is not None else set()
+    storage = Recipe._meta.get_field('image').storage
+    for name in set(names) - used:
+        storage.delete(name)
+
+
+def make_recipe_renditions(recipe_id, image_name, old_names=()):
+    """
+    Уменьшенные копии фото рецепта в WebP.
+    Если за время обработки фото заменили, результат выбрасывается.
+    Файлы прежнего фото из old_names удаляются в конце обработки.
+    """
+    try:
+        _make_recipe_renditions(recipe_id, image_name)
+    finally:
+        if old_names:
+            _delete_unused_images(recipe_id, old_names)
+
+
+def _make_recipe_renditions(recipe_id, image_name):
+    recipe = Recipe.objects.only('image').filter(pk=recipe_id).first()
+    if recipe is None or recipe.image.name != image_name:
+        return
+    stem = Path(image_name).stem
+    names = {}
+    with recipe.image.open('rb') as file, Image.open(file) as image:
+        image.draft('RGB', (RECIPE_RENDITIONS[0][1],) * 2)
+        rendition = ImageOps.exif_transpose(image)
+        if rendition.mode not in ('RGB', 'RGBA'):
+            rendition = rendition.convert(
+                'RGBA' if 'transparency' in rendition.info
+                or rendition.mode.endswith('A') else 'RGB')
+        for field, size in RECIPE_RENDITIONS:
+            rendition = rendition.copy()
+            rendition.thumbnail((size, size))
+            buffer = BytesIO()
+            rendition.save(buffer, RENDITION_FORMAT,
+                           quality=RENDITION_QUALITY)
+            getattr(recipe, field).save(f'{stem}.{RENDITION_FORMAT}',
+                                        ContentFile(buffer.getvalue()),
+                                        save=False)
+            names[field] = getattr(recipe, field).name
+    if Recipe.objects.filter(pk=recipe_id, image=image_name).update(**names):
+        bump_versions(RECIPES_VERSION, RECIPE_VERSION.format(recipe_id))
+    else:
+        for field in names:
+            getattr(recipe, field).delete(save=False)
@@ -0,0 +1,884 @@
+import base64
+from asyncio import iscoroutinefunction
+from datetime import timedelta
+from io import BytesIO, StringIO
+from tempfile import TemporaryDirectory
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.db import connection
+from django.test import (AsyncClient, TestCase, TransactionTestCase,
+                         override_settings)
+from django.test.utils import CaptureQueriesContext
+from django.urls import include, path
+from django.utils import timezone
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from .async_views import with_async_reads
+from .authentication import token_cache_key
+from .constants import (COUNT_ESTIMATE_THRESHOLD, INGREDIENT_SEARCH_LIMIT,
+                        NOT_EXIST_INGREDIENT_ERROR, NOT_EXIST_TAG_ERROR)
+from .paginations import CachedCountPaginator
+from .reference import IngredientRow, ReferenceData, reference
+from .tasks import (export_shopping_list, make_recipe_renditions,
+                    recipe_image_names)
+from .urls import router
+
+from recipes.models import (Best, Ingredient, IngredientRecipe, Recipe,
+                            ShopCart, ShopListItem, ShoppingListExport, Tag,
+                            User)
+from users.models import Follow
+
+RECIPES_LIST_QUERIES = 7
+RECIPES_LIST_ANONYMOUS_QUERIES = 6
+
+urlpatterns = [
+    path('api/', include(with_async_reads(router.urls))),
+]
+
+
+async def async_get(url, **headers):
+    return await AsyncClient().get(url, **headers)
+
+
+def png_data_uri(color):
+    buffer = BytesIO()
+    Image.new('RGB', (64, 64), color).save(buffer, 'PNG')
+    return ('data:image/png;base64,'
+            + base64.b64encode(buffer.getvalue()).decode())
+
+
+def clear_caches():
+    for alias_cache in caches.all():
+        alias_cache.clear()
+
+
+class RecipeListQueriesTest(TestCase):
+    """ Число запросов ленты не зависит от размера страницы. """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='reader', email='reader@example.com',
+            password='password', first_name='Имя', last_name='Фамилия')
+        Tag.objects.bulk_create(
+            Tag(name=f'Тег {number}', color='#FF0000', slug=f'tag{number}')
+            for number in range(3))
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f'Ингредиент {number}', measurement_unit='г')
+            for number in range(5))
+        for number in range(12):
+            recipe = Recipe.objects.create(
+                author=cls.user, name=f'Рецепт {number}', text='Текст',
+                cooking_time=10)
+            recipe.tags.set(Tag.objects.all()[:2])
+            IngredientRecipe.objects.bulk_create(
+                IngredientRecipe(recipe=recipe, ingredient=ingredient,
+                                 amount=number + 1)
+                for ingredient in Ingredient.objects.all()[:4])
+
+    def assert_list_queries(self, client, queries):
+        for limit in (1, 12):
+            with self.subTest(limit=limit):
+                clear_caches()
+                with self.assertNumQueries(queries):
+                    response = client.get(f'/api/recipes/?limit={limit}')
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.json()['results']), limit)
+
+    def test_anonymous(self):
+        self.assert_list_queries(APIClient(),
+                                 RECIPES_LIST_ANONYMOUS_QUERIES)
+
+    def test_authenticated(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        self.assert_list_queries(client, RECIPES_LIST_QUERIES)
+
+
+class SubscriptionRecipesLimitTest(TestCase):
+    """ recipes_limit ограничивает рецепты авторов в подписках. """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader, author = (
+            User.objects.create_user(
+                username=name, email=f'{name}@example.com',
+                password='password', first_name='Имя', last_name='Фамилия')
+            for name in ('reader', 'author'))
+        Follow.objects.create(user=cls.reader, author=author)
+        for number in range(3):
+            Recipe.objects.create(author=author, name=f'Рецепт {number}',
+                                  text='Текст', cooking_time=10)
+
+    def test_recipes_limit(self):
+        client = APIClient()
+        client.force_authenticate(self.reader)
+        for recipes_limit, expected in (('0', 0), ('2', 2), ('', 3)):
+            with self.subTest(recipes_limit=recipes_limit):
+                response = client.get('/api/users/subscriptions/',
+                                      {'recipes_limit': recipes_limit})
+                self.assertEqual(response.status_code, 200)
+                author, = response.json()['results']
+                self.assertEqual(len(author['recipes']), expected)
+                self.assertEqual(author['recipes_count'], 3)
+
+    def test_recipes_limit_with_same_pub_date(self):
+        Recipe.objects.update(pub_date=timezone.now())
+        latest = list(Recipe.objects.order_by('-id').values_list(
+            'id', flat=True)[:2])
+        client = APIClient()
+        client.force_authenticate(self.reader)
+        for _ in range(3):
+            response = client.get('/api/users/subscriptions/',
+                                  {'recipes_limit': 2})
+            author, = response.json()['results']
+            self.assertEqual(
+                sorted((recipe['id'] for recipe in author['recipes']),
+                       reverse=True), latest)
+
+
+class ShopListUpkeepTest(TestCase):
+    """ Таблица списков покупок совпадает с корзинами при любой записи. """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, cls.author = (
+            User.objects.create_user(
+                username=name, email=f'{name}@example.com',
+                password='password', first_name='Имя', last_name='Фамилия')
+            for name in ('buyer', 'cook'))
+        cls.tag = Tag.objects.create(name='Тег', color='#FF0000', slug='tag')
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f'Ингредиент {number}', measurement_unit='г')
+            for number in range(4))
+        cls.ingredients = list(Ingredient.objects.all())
+
+    def setUp(self):
+        self.recipes = []
+        for number in range(2):
+            recipe = Recipe.objects.create(
+                author=self.author, name=f'Рецепт {number}', text='Текст',
+                cooking_time=10)
+            recipe.tags.set((self.tag,))
+            for ingredient in self.ingredients[number:number + 3]:
+                IngredientRecipe.objects.create(
+                    recipe=recipe, ingredient=ingredient, amount=10)
+            self.recipes.append(recipe)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def assert_in_sync(self):
+        self.assertEqual(
+            {(row.user_id, row.ingredient_id): row.amount
+             for row in ShopListItem.objects.all()},
+            ShopListItem.objects.expected())
+
+    def test_api_cart(self):
+        for recipe in self.recipes:
+            response = self.client.post(
+                f'/api/recipes/{recipe.pk}/shopping_cart/')
+            self.assertEqual(response.status_code, 201)
+        self.assertEqual(ShopListItem.objects.get(
+            user=self.user, ingredient=self.ingredients[1]).amount, 20)
+        response = self.client.delete(
+            f'/api/recipes/{self.recipes[0].pk}/shopping_cart/')
+        self.assertEqual(response.status_code, 204)
+        self.assert_in_sync()
+
+    def test_recipe_update_and_destroy(self):
+        recipe = self.recipes[0]
+        ShopCart.objects.create(user=self.user, recipe=recipe)
+        author = APIClient()
+        author.force_authenticate(self.author)
+        response = author.patch(f'/api/recipes/{recipe.pk}/', {
+            'tags': [self.tag.pk],
+            'ingredients': [{'id': self.ingredients[0].pk, 'amount': 5},
+                            {'id': self.ingredients[3].pk, 'amount': 7}]},
+            format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assert_in_sync()
+        response = author.delete(f'/api/recipes/{recipe.pk}/')
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(ShopListItem.objects.exists())
+
+    def test_model_writes(self):
+        first, second = self.recipes
+        cart = ShopCart.objects.create(user=self.user, recipe=first)
+        ShopCart.objects.create(user=self.user, recipe=second)
+        self.assert_in_sync()
+        row = first.ingredientrecipe.first()
+        row.amount = 25
+        row.save()
+        self.assert_in_sync()
+        row.delete()
+        self.assert_in_sync()
+        IngredientRecipe.objects.create(
+            recipe=first, ingredient=self.ingredients[3], amount=4)
+        self.assert_in_sync()
+        cart.recipe = second
+        cart.user = self.author
+        cart.save()
+        self.assert_in_sync()
+        second.delete()
+        self.assert_in_sync()
+        self.assertFalse(ShopListItem.objects.exists())
+
+    def test_recipe_queryset_delete(self):
+        for recipe in self.recipes:
+            ShopCart.objects.create(user=self.user, recipe=recipe)
+        Recipe.objects.filter(pk=self.recipes[0].pk).delete()
+        self.assert_in_sync()
+        ShopCart.objects.all().delete()
+        self.assertFalse(ShopListItem.objects.exists())
+
+    def test_recipe_in_many_carts(self):
+        recipe = self.recipes[0]
+        User.objects.bulk_create(
+            User(username=f'buyer{number}', email=f'buyer{number}@example.com',
+                 first_name='Имя', last_name='Фамилия')
+            for number in range(4000))
+        ShopCart.objects.bulk_create(
+            ShopCart(user_id=user_id, recipe=recipe)
+            for user_id in User.objects.filter(
+                username__startswith='buyer').values_list('id', flat=True))
+        ShopListItem.objects.bulk_create(
+            ShopListItem(user_id=user_id, ingredient_id=ingredient_id,
+                         amount=amount)
+            for (user_id, ingredient_id), amount
+            in ShopListItem.objects.expected().items())
+        with CaptureQueriesContext(connection) as context:
+            for row in recipe.ingredientrecipe.all():
+                row.amount += 5
+                row.save()
+            IngredientRecipe.objects.create(
+                recipe=recipe, ingredient=self.ingredients[3], amount=4)
+            recipe.ingredientrecipe.first().delete()
+        self.assert_in_sync()
+        self.assertLess(max(len(query['sql'])
+                            for query in context.captured_queries), 20000)
+
+
+class CachedTokenAuthenticationTest(TestCase):
+    """ Снимок пользователя в кеше не содержит хеша пароля и токена. """
+
+    def setUp(self):
+        clear_caches()
+        self.user = User.objects.create_user(
+            username='reader', email='reader@example.com',
+            password='old-password-123', first_name='Имя',
+            last_name='Фамилия')
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def test_cached_snapshot(self):
+        for _ in range(2):
+            response = self.client.get('/api/users/me/')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json()['username'], 'reader')
+        snapshot = cache.get(token_cache_key(self.token.key))
+        self.assertIsNotNone(snapshot)
+        self.assertNotIn(self.user.password, str(snapshot))
+        self.assertNotIn(self.token.key, str(snapshot))
+
+    def test_password_and_logout_with_cached_user(self):
+        self.client.get('/api/users/me/')
+        response = self.client.post('/api/users/set_password/', {
+            'current_password': 'old-password-123',
+            'new_password': 'new-password-456'})
+        self.assertEqual(response.status_code, 204)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password('new-password-456'))
+        self.client.get('/api/users/me/')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/auth/token/logout/')
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(Token.objects.exists())
+        self.assertEqual(self.client.get('/api/users/me/').status_code, 401)
+
+
+@override_settings(QUERY_BUDGET_STRICT=True)
+class QueryBudgetTest(TestCase):
+    """ Маршруты с бюджетом укладываются в него и при пустом кеше. """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader, *authors = (
+            User.objects.create_user(
+                username=name, email=f'{name}@example.com',
+                password='password', first_name='Имя', last_name='Фамилия')
+            for name in ('reader', 'first', 'second'))
+        cls.token = Token.objects.create(user=cls.reader)
+        cls.tag = Tag.objects.create(name='Тег', color='#FF0000', slug='tag')
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f'Ингредиент {number}', measurement_unit='г')
+            for number in range(4))
+        for number in range(8):
+            author = authors[number % 2]
+            recipe = Recipe.objects.create(
+                author=author, name=f'Рецепт {number}', text='Текст',
+                cooking_time=10)
+            recipe.tags.set((cls.tag,))
+            IngredientRecipe.objects.bulk_create(
+                IngredientRecipe(recipe=recipe, ingredient=ingredient,
+                                 amount=number + 1)
+                for ingredient in Ingredient.objects.all()[:3])
+            if number % 2:
+                ShopCart.objects.create(user=cls.reader, recipe=recipe)
+                Best.objects.create(user=cls.reader, recipe=recipe)
+        for author in authors:
+            Follow.objects.create(user=cls.reader, author=author)
+        cls.recipe = recipe
+        cls.author = authors[0]
+
+    def test_empty_cache(self):
+        authorized = APIClient()
+        authorized.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        public_urls = (
+            '/api/recipes/',
+            f'/api/recipes/?author={self.author.pk}',
+            f'/api/recipes/{self.recipe.pk}/',
+            '/api/tags/',
+            '/api/ingredients/',
+            '/api/ingredients/?name=инг',
+        )
+        private_urls = (
+            '/api/recipes/?is_favorited=1&is_in_shopping_cart=1&tags=tag',
+            '/api/recipes/download_shopping_cart/',
+            '/api/users/subscriptions/?recipes_limit=2',
+        )
+        for client, urls in ((authorized, public_urls + private_urls),
+                             (APIClient(), public_urls)):
+            for url in urls:
+                with self.subTest(url=url, authorized=client is authorized):
+                    clear_caches()
+                    response = client.get(url)
+                    self.assertEqual(response.status_code, 200)
+
+
+class AuthorChangeVersionTest(TestCase):
+    """ Регистрация не сбрасывает версии рецептов, смена имени автора да. """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='cook', email='cook@example.com', password='password',
+            first_name='Имя', last_name='Фамилия')
+        cls.recipe = Recipe.objects.create(
+            author=cls.author, name='Рецепт', text='Текст', cooking_time=10)
+
+    def setUp(self):
+        clear_caches()
+        self.url = f'/api/recipes/{self.recipe.pk}/'
+
+    def test_signup_keeps_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/users/', {
+                'email': 'new@example.com', 'username': 'newcomer',
+                'first_name': 'Имя', 'last_name': 'Фамилия',
+                'password': 'new-password-456'})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.client.get(self.url)['ETag'], etag)
+
+    def test_author_rename_changes_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.author.first_name = 'Другое'
+            self.author.save()
+        response = self.client.get(self.url)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()['author']['first_name'], 'Другое')
+
+
+class MetricsTest(TestCase):
+    """ Метрики закрыты без токена, сериализация замеряется отдельно. """
+
+    def test_access(self):
+        staff = User.objects.create_user(
+            username='admin', email='admin@example.com', password='password',
+            first_name='Имя', last_name='Фамилия', is_staff=True)
+        self.assertEqual(self.client.get('/api/metrics').status_code, 403)
+        with override_settings(METRICS_TOKEN='secret'):
+            self.assertEqual(self.client.get(
+                '/api/metrics', HTTP_AUTHORIZATION='Bearer wrong'
+            ).status_code, 403)
+            response = self.client.get('/api/metrics',
+                                       HTTP_AUTHORIZATION='Bearer secret')
+            self.assertEqual(response.status_code, 200)
+        self.client.force_login(staff)
+        response = self.client.get('/api/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'foodgramm_serialize_seconds_total', response.content)
+
+    def test_server_timing(self):
+        response = self.client.get('/api/recipes/')
+        self.assertEqual(response.status_code, 200)
+        self.assertRegex(response['Server-Timing'],
+                         r'serialize;dur=\d+\.\d, render;dur=')
+
+
+class ShoppingListExportTest(TestCase):
+    """ Фоновая выгрузка: 202, опрос, переход к файлу, зависшие задания. """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='buyer', email='buyer@example.com', password='password',
+            first_name='Имя', last_name='Фамилия')
+        recipe = Recipe.objects.create(
+            author=cls.user, name='Рецепт', text='Текст', cooking_time=10)
+        IngredientRecipe.objects.create(
+            recipe=recipe, ingredient=Ingredient.objects.create(
+                name='Соль', measurement_unit='г'), amount=5)
+        ShopCart.objects.create(user=cls.user, recipe=recipe)
+
+    def setUp(self):
+        directory = TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        media = override_settings(MEDIA_ROOT=directory.name)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_export_and_poll(self):
+        with mock.patch('api.views.submit') as submit:
+            response = self.client.post(
+                '/api/recipes/download_shopping_cart/',
+                HTTP_ACCEPT='text/plain')
+        self.assertEqual(response.status_code, 202)
+        location = response['Location']
+        export = ShoppingListExport.objects.get(pk=response.json()['id'])
+        submit.assert_called_once_with(export_shopping_list, export.pk)
+        response = self.client.get(location)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['status'], 'pending')
+        export_shopping_list(export.pk)
+        response = self.client.get(location)
+        self.assertEqual(response.status_code, 302)
+        export.refresh_from_db()
+        self.assertEqual(response['Location'], export.file.url)
+        with export.file.open('rb') as file:
+            self.assertIn('Соль'.encode(), file.read())
+
+    def test_stale_and_expired(self):
+        stale = ShoppingListExport.objects.create(user=self.user,
+                                                  format='txt')
+        ShoppingListExport.objects.filter(pk=stale.pk).update(
+            created=timezone.now() - timedelta(hours=1))
+        response = self.client.get(f'/api/shopping_list_exports/{stale.pk}/')
+        self.assertEqual(response.json()['status'], 'failed')
+        done = ShoppingListExport.objects.create(user=self.user,
+                                                 format='txt')
+        export_shopping_list(done.pk)
+        done.refresh_from_db()
+        storage, name = done.file.storage, done.file.name
+        self.assertTrue(storage.exists(name))
+        ShoppingListExport.objects.update(
+            created=timezone.now() - timedelta(days=2))
+        call_command('clean_exports', stdout=StringIO())
+        self.assertFalse(ShoppingListExport.objects.exists())
+        self.assertFalse(storage.exists(name))
+
+
+class ConditionalRecipeTest(TestCase):
+    """ Условный GET рецепта и ETag с флагами пользователя. """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, cls.author = (
+            User.objects.create_user(
+                username=name, email=f'{name}@example.com',
+                password='password', first_name='Имя', last_name='Фамилия')
+            for name in ('reader', 'cook'))
+        cls.recipe = Recipe.objects.create(
+            author=cls.author, name='Рецепт', text='Текст', cooking_time=10)
+
+    def setUp(self):
+        clear_caches()
+        self.url = f'/api/recipes/{self.recipe.pk}/'
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_not_modified(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        for headers in ({'HTTP_IF_NONE_MATCH': response['ETag']},
+                        {'HTTP_IF_MODIFIED_SINCE': response['Last-Modified']}):
+            with self.subTest(headers=headers):
+                cached = self.client.get(self.url, **headers)
+                self.assertEqual(cached.status_code, 304)
+                self.assertEqual(cached['ETag'], response['ETag'])
+        self.assertEqual(self.client.get(
+            self.url, HTTP_IF_NONE_MATCH='"stale"').status_code, 200)
+
+    def test_etag_follows_user_flags(self):
+        for url, field in (
+                (f'{self.url}favorite/', 'is_favorited'),
+                (f'{self.url}shopping_cart/', 'is_in_shopping_cart'),
+                (f'/api/users/{self.author.pk}/subscribe/', None)):
+            with self.subTest(url=url):
+                etag = self.client.get(self.url)['ETag']
+                with self.captureOnCommitCallbacks(execute=True):
+                    self.assertEqual(self.client.post(url).status_code, 201)
+                response = self.client.get(self.url,
+                                           HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+                self.assertNotEqual(response['ETag'], etag)
+                data = response.json()
+                self.assertTrue(data[field] if field
+                                else data['author']['is_subscribed'])
+
+
+class CachedCountTest(TestCase):
+    """ Количество записей берется из кеша до смены версии таблицы. """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, cls.author = (
+            User.objects.create_user(
+                username=name, email=f'{name}@example.com',
+                password='password', first_name='Имя', last_name='Фамилия')
+            for name in ('reader', 'cook'))
+        for number in range(3):
+            Recipe.objects.create(author=cls.author, name=f'Рецепт {number}',
+                                  text='Текст', cooking_time=10)
+
+    def setUp(self):
+        clear_caches()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def counts(self):
+        return [self.client.get(url).json()['count']
+                for url in ('/api/recipes/',
+                            f'/api/recipes/?author={self.author.pk}')]
+
+    def test_cache_and_invalidation(self):
+        self.assertEqual(self.counts(), [3, 3])
+        Recipe.objects.bulk_create((Recipe(
+            author=self.user, name='Без сигналов', text='Текст',
+            cooking_time=10),))
+        self.assertEqual(self.counts(), [3, 3])
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe = Recipe.objects.create(
+                author=self.author, name='Новый', text='Текст',
+                cooking_time=10)
+        self.assertEqual(self.counts(), [5, 4])
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.delete()
+        self.assertEqual(self.counts(), [4, 3])
+
+    def test_estimate(self):
+        queryset = Recipe.objects.all()
+        connection = mock.MagicMock(vendor='postgresql')
+        cursor = connection.cursor.return_value.__enter__.return_value
+        with mock.patch('api.paginations.connections',
+                        {queryset.db: connection}):
+            for estimate, expected in ((COUNT_ESTIMATE_THRESHOLD,
+                                        COUNT_ESTIMATE_THRESHOLD),
+                                       (COUNT_ESTIMATE_THRESHOLD - 1, 3)):
+                with self.subTest(estimate=estimate):
+                    cursor.fetchone.return_value = (estimate,)
+                    self.assertEqual(
+                        CachedCountPaginator(queryset, 10).count, expected)
+            cursor.execute.reset_mock()
+            self.assertEqual(CachedCountPaginator(
+                queryset.filter(author=self.author), 10).count, 3)
+            cursor.execute.assert_not_called()
+
+
+class RecipeCursorPaginationTest(TestCase):
+    """ Курсорная лента без повторов и пропусков при равных датах. """
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(
+            username='cook', email='cook@example.com', password='password',
+            first_name='Имя', last_name='Фамилия')
+        for number in range(11):
+            Recipe.objects.create(author=author, name=f'Рецепт {number}',
+                                  text='Текст', cooking_time=10)
+        pub_date = timezone.now()
+        Recipe.objects.filter(id__gt=Recipe.objects.order_by('id')[2].id
+                              ).update(pub_date=pub_date)
+
+    def walk(self, url, link):
+        ids = []
+        while url:
+            data = self.client.get(url).json()
+            ids += [recipe['id'] for recipe in data['results']]
+            url = data[link]
+        return ids
+
+    def test_walk_all_pages(self):
+        expected = list(Recipe.objects.order_by('-id').values_list(
+            'id', flat=True))
+        clear_caches()
+        for limit in (1, 3, 4):
+            with self.subTest(limit=limit):
+                ids = self.walk(
+                    f'/api/recipes/?pagination=cursor&limit={limit}', 'next')
+                self.assertEqual(ids, expected)
+
+    def test_delete_between_pages(self):
+        expected = list(Recipe.objects.order_by('-id').values_list(
+            'id', flat=True))
+        clear_caches()
+        page = self.client.get('/api/recipes/?pagination=cursor&limit=3'
+                               ).json()
+        ids = [recipe['id'] for recipe in page['results']]
+        Recipe.objects.filter(pk=ids[0]).delete()
+        clear_caches()
+        self.assertEqual(ids + self.walk(page['next'], 'next'), expected)
+
+    def test_walk_back(self):
+        expected = list(Recipe.objects.order_by('-id').values_list(
+            'id', flat=True))
+        clear_caches()
+        for limit in (1, 3, 4):
+            with self.subTest(limit=limit):
+                page = self.client.get(
+                    f'/api/recipes/?pagination=cursor&limit={limit}').json()
+                while page['next']:
+                    page = self.client.get(page['next']).json()
+                ids = self.walk(page['previous'], 'previous')
+                self.assertCountEqual(
+                    ids + [recipe['id'] for recipe in page['results']],
+                    expected)
+
+
+class RecipeReferencesTest(TestCase):
+    """ Проверка id тегов и ингредиентов рецепта по снимку и базе. """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='cook', email='cook@example.com', password='password',
+            first_name='Имя', last_name='Фамилия')
+        cls.tag = Tag.objects.create(name='Тег', color='#FF0000', slug='tag')
+        cls.ingredient = Ingredient.objects.create(name='Соль',
+                                                   measurement_unit='г')
+        cls.recipe = Recipe.objects.create(
+            author=cls.author, name='Рецепт', text='Текст', cooking_time=10)
+
+    def setUp(self):
+        clear_caches()
+        self.url = f'/api/recipes/{self.recipe.pk}/'
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+
+    def patch(self, tags, ingredients):
+        return self.client.patch(self.url, {
+            'tags': tags,
+            'ingredients': [{'id': pk, 'amount': 5} for pk in ingredients]},
+            format='json')
+
+    def test_unknown_ids_in_one_error(self):
+        response = self.patch([self.tag.pk, 9998, 9999],
+                              [9997, self.ingredient.pk, 9996])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {
+            'tags': [NOT_EXIST_TAG_ERROR.format('9998, 9999')],
+            'ingredients': [NOT_EXIST_INGREDIENT_ERROR.format('9997, 9996')],
+        })
+
+    def test_ids_missing_from_snapshot(self):
+        reference.get()
+        Tag.objects.bulk_create((Tag(
+            name='Новый', color='#00FF00', slug='new'),))
+        Ingredient.objects.bulk_create((Ingredient(
+            name='Перец', measurement_unit='г'),))
+        tag = Tag.objects.get(slug='new')
+        ingredient = Ingredient.objects.get(name='Перец')
+        self.assertNotIn(tag.pk, reference.get().tags_by_id)
+        response = self.patch([self.tag.pk, tag.pk],
+                              [self.ingredient.pk, ingredient.pk])
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual({item['id'] for item in data['tags']},
+                         {self.tag.pk, tag.pk})
+        self.assertEqual({item['id'] for item in data['ingredients']},
+                         {self.ingredient.pk, ingredient.pk})
+
+
+class ReferenceDataTest(TestCase):
+    """ Поиск ингредиентов по снимку и перечитывание снимка. """
+
+    def test_search_ingredients(self):
+        names = ('Сахар', 'сахарная пудра', 'Тростниковый САХАР', 'Соль',
+                 'Ванильный сахар')
+        data = ReferenceData(None, (), tuple(
+            IngredientRow(pk, name, 'г') for pk, name in enumerate(names)))
+        self.assertEqual(
+            [ingredient.name for ingredient
+             in data.search_ingredients('САХ')],
+            ['Сахар', 'сахарная пудра', 'Ванильный сахар',
+             'Тростниковый САХАР'])
+        self.assertEqual(data.search_ingredients('перец'), [])
+
+    def test_search_limit(self):
+        data = ReferenceData(None, (), tuple(
+            IngredientRow(pk, name, 'г') for pk, name in enumerate(
+                [f'мука {number:03}' for number in range(60)]
+                + [f'ржаная мука {number:03}' for number in range(10)])))
+        found = data.search_ingredients('мука')
+        self.assertEqual(len(found), INGREDIENT_SEARCH_LIMIT)
+        self.assertTrue(all(ingredient.name.startswith('мука')
+                            for ingredient in found))
+        found = data.search_ingredients('ржаная')
+        self.assertEqual(len(found), 10)
+
+    def test_reload_after_version_bump(self):
+        clear_caches()
+        tag = Tag.objects.create(name='Тег', color='#FF0000', slug='tag')
+        first = reference.get()
+        self.assertIs(reference.get(), first)
+        for model, fields in (
+                (Tag, {'name': 'Новый', 'color': '#00FF00', 'slug': 'new'}),
+                (Ingredient, {'name': 'Соль', 'measurement_unit': 'г'})):
+            with self.subTest(model=model.__name__):
+                with self.captureOnCommitCallbacks(execute=True):
+                    item = model.objects.create(**fields)
+                data = reference.get()
+                self.assertIsNot(data, first)
+                self.assertIn(item.pk, getattr(
+                    data, model._meta.model_name + 's_by_id'))
+                first = data
+        self.assertCountEqual(
+            [item['slug'] for item in self.client.get('/api/tags/').json()],
+            [tag.slug, 'new'])
+
+
+@override_settings(QUERY_BUDGET_STRICT=True)
+class AsyncReadViewsTest(TransactionTestCase):
+    """
+    Асинхронные обработчики отвечают так же, как синхронные,
+    и укладываются в те же бюджеты SQL-запросов.
+    """
+
+    def setUp(self):
+        self.reader, *authors = (
+            User.objects.create_user(
+                username=name, email=f'{name}@example.com',
+                password='password', first_name='Имя', last_name='Фамилия')
+            for name in ('reader', 'first', 'second'))
+        self.token = Token.objects.create(user=self.reader)
+        tag = Tag.objects.create(name='Тег', color='#FF0000', slug='tag')
+        Ingredient.objects.bulk_create(
+            Ingredient(name=name, measurement_unit='г')
+            for name in ('Сахар', 'Соль', 'Ванильный сахар'))
+        for number in range(5):
+            recipe = Recipe.objects.create(
+                author=authors[number % 2], name=f'Рецепт {number}',
+                text='Текст', cooking_time=10)
+            recipe.tags.set((tag,))
+            for ingredient in Ingredient.objects.all()[:2]:
+                IngredientRecipe.objects.create(
+                    recipe=recipe, ingredient=ingredient, amount=number + 1)
+            if number % 2:
+                Best.objects.create(user=self.reader, recipe=recipe)
+            else:
+                ShopCart.objects.create(user=self.reader, recipe=recipe)
+        Follow.objects.create(user=self.reader, author=authors[0])
+        self.recipe, self.tag = recipe, tag
+        self.ingredient = Ingredient.objects.first()
+
+    def test_same_responses(self):
+        public_urls = (
+            '/api/recipes/',
+            '/api/recipes/?limit=2&page=2',
+            '/api/recipes/?page=9',
+            '/api/recipes/?is_favorited=1&tags=tag',
+            f'/api/recipes/{self.recipe.pk}/',
+            '/api/recipes/999999/',
+            '/api/tags/',
+            f'/api/tags/{self.tag.pk}/',
+            '/api/ingredients/',
+            '/api/ingredients/?name=сах',
+            f'/api/ingredients/{self.ingredient.pk}/',
+        )
+        private_urls = (
+            '/api/users/subscriptions/',
+            '/api/users/subscriptions/?recipes_limit=1',
+        )
+        header = f'Token {self.token.key}'
+        for authorized, urls in ((True, public_urls + private_urls),
+                                 (False, public_urls)):
+            for url in urls:
+                with self.subTest(url=url, authorized=authorized):
+                    clear_caches()
+                    expected = self.client.get(url, **(
+                        {'HTTP_AUTHORIZATION': header} if authorized
+                        else {}))
+                    clear_caches()
+                    with override_settings(ROOT_URLCONF=__name__):
+                        response = async_to_sync(async_get)(url, **(
+                            {'authorization': header} if authorized
+                            else {}))
+                    self.assertTrue(iscoroutinefunction(
+                        response.asgi_request.resolver_match.func))
+                    self.assertFalse(iscoroutinefunction(
+                        expected.wsgi_request.resolver_match.func))
+                    self.assertEqual(response.status_code,
+                                     expected.status_code)
+                    self.assertEqual(response.json(), expected.json())
+
+
+class RecipeRenditionsTest(TestCase):
+    """ Копии фото ставятся в очередь, прежние файлы удаляются. """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='cook', email='cook@example.com', password='password',
+            first_name='Имя', last_name='Фамилия')
+        cls.tag = Tag.objects.create(name='Тег', color='#FF0000', slug='tag')
+        cls.ingredient = Ingredient.objects.create(name='Соль',
+                                                   measurement_unit='г')
+
+    def setUp(self):
+        clear_caches()
+        directory = TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        media = override_settings(MEDIA_ROOT=directory.name)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+
+    def save(self, method, url, color):
+        with mock.patch('api.serializers.submit') as submit:
+            response = getattr(self.client, method)(url, {
+                'name': 'Рецепт', 'text': 'Текст', 'cooking_time': 10,
+                'tags': [self.tag.pk], 'image': png_data_uri(color),
+                'ingredients': [{'id': self.ingredient.pk, 'amount': 5}]},
+                format='json')
+        self.assertIn(response.status_code, (200, 201))
+        recipe = Recipe.objects.get(pk=response.json()['id'])
+        task, *args = submit.call_args.args
+        self.assertIs(task, make_recipe_renditions)
+        self.assertEqual(args[:2], [recipe.pk, recipe.image.name])
+        url = f'/api/recipes/{recipe.pk}/'
+        etag = self.client.get(url)['ETag']
+        task(*args)
+        self.assertNotEqual(self.client.get(url)['ETag'], etag)
+        recipe.refresh_from_db()
+        self.assertTrue(recipe.image_preview and recipe.image_thumbnail)
+        return recipe
+
+    def test_create_and_replace(self):
+        recipe = self.save('post', '/api/recipes/', 'orange')
+        old_names = recipe_image_names(recipe)
+        self.assertEqual(len(old_names), 3)
+        recipe = self.save('patch', f'/api/recipes/{recipe.pk}/', 'green')
+        storage = recipe.image.storage
+        self.assertFalse(any(storage.exists(name) for name in old_names))
+        self.assertTrue(all(storage.exists(name)
+                            for name in recipe_image_names(recipe)))
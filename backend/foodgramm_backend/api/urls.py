@@ -1,8 +1,12 @@
+from django.conf import settings
 from django.urls import include, path
 from rest_framework import routers
 
+from .async_views import with_async_reads
+from .metrics import metrics_view
 from .views import (TagViewSet, UserViewSet,
-                    IngredientViewSet, RecipeViewSet)
+                    IngredientViewSet, RecipeViewSet,
+                    ShoppingListExportViewSet)
 
 
 router = routers.DefaultRouter()
@@ -10,8 +14,15 @@ router.register('tags', TagViewSet, basename='tags')
 router.register('ingredients', IngredientViewSet, basename='ingredients')
 router.register('users', UserViewSet, basename='users')
 router.register('recipes', RecipeViewSet, basename='recipes')
+router.register('shopping_list_exports', ShoppingListExportViewSet,
+                basename='shopping_list_exports')
+
+router_urls = router.urls
+if settings.ASYNC_READ_VIEWS:
+    router_urls = with_async_reads(router_urls)
 
 urlpatterns = [
-    path('', include(router.urls)),
+    path('', include(router_urls)),
     path('auth/', include('djoser.urls.authtoken')),
+    path('metrics', metrics_view, name='metrics'),
 ]
@@ -0,0 +1,32 @@
+from time import time
+
+from django.core.cache import cache
+
+VERSION_KEY = 'version:{}'
+
+
+def _now():
+    return int(time() * 1000)
+
+
+def get_versions(*names):
+    """
+    Текущие версии данных по именам.
+    Версия — метка времени в миллисекундах, поэтому после вытеснения
+    из кеша новая версия всегда больше любой из прежних.
+    """
+    keys = [VERSION_KEY.format(name) for name in names]
+    versions = cache.get_many(keys)
+    missing = {key: _now() for key in keys if key not in versions}
+    if missing:
+        cache.set_many(missing, None)
+        versions.update(missing)
+    return [versions[key] for key in keys]
+
+
+def bump_versions(*names):
+    keys = [VERSION_KEY.format(name) for name in names]
+    versions = cache.get_many(keys)
+    now = _now()
+    cache.set_many({key: max(versions.get(key, 0) + 1, now)
+                    for key in keys}, None)
@@ -1,24 +1,42 @@
-from django.db.models import Sum
-from django.http import FileResponse
+from django.conf import settings
+from django.db.models import Count, Prefetch, prefetch_related_objects
+from django.http import (FileResponse, Http404, HttpResponse,
+                         HttpResponseRedirect)
+from django.urls import reverse
+from django.utils.cache import get_conditional_response, patch_cache_control
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet as DjoserUserViewSet
 from rest_framework import viewsets, permissions, status, mixins
 from rest_framework.decorators import action
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 
 from .constants import (SUCCESS_UNFOLLOW, FOLLOWING_NOT_FOUND,
-                        RECIPE_NOT_FOUND)
+                        RECIPE_NOT_FOUND, SHOP_LIST_FILENAME,
+                        PAGINATION_QUERY_PARAM, CURSOR_PAGINATION,
+                        RECIPES_VERSION, RECIPE_VERSION, REFERENCE_VERSION,
+                        TAGS_VERSION, INGREDIENTS_VERSION, USER_VERSION)
+from .caching import (cached_response, conditional_response,
+                      serialize_recipes)
 from .filters import IngredientFilter, RecipeFilter
+from .paginations import RecipeCursorPagination
 from .permissions import IsAuthorOrReadOnly
+from .reference import reference
 from .serializers import (FollowSerializer, TagSerializer,
                           IngredientSerializer, RecipeRetriveSerializer,
                           RecipeModifySerializer, SubscriptionSerializer,
-                          BestSerializer, ShopCartSerializer)
+                          BestSerializer, ShopCartSerializer,
+                          ShoppingListExportSerializer)
 from recipes.models import (Tag, Ingredient, Recipe,
-                            Best, ShopCart, IngredientRecipe,
-                            User)
+                            Best, ShopCart,
+                            ShoppingListExport, User)
 from users.models import Follow
-from .prepare_pdf import prepare_pdf_buffer
+from .renderers import CSVRenderer, PDFRenderer, TextRenderer
+from .shopping_list import (shopping_list_etag, shopping_list_pdf,
+                            shopping_list_queryset, shopping_list_stream)
+from .tasks import export_shopping_list, submit
+from .versions import get_versions
 
 
 class UserViewSet(DjoserUserViewSet):
@@ -31,8 +49,17 @@ class UserViewSet(DjoserUserViewSet):
 
     @action(detail=False, methods=['get'])
     def subscriptions(self, request):
-        queryset = User.objects.filter(following__user=self.request.user)
+        queryset = User.objects.filter(
+            following__user=self.request.user).annotate(
+            recipes_count=Count('recipes')).order_by('username')
         page = self.paginate_queryset(queryset)
+        recipes = Recipe.objects.all()
+        recipes_limit = SubscriptionSerializer.get_recipes_limit(request)
+        if recipes_limit is not None:
+            recipes = Recipe.objects.latest_per_author(
+                [author.id for author in page], recipes_limit)
+        prefetch_related_objects(page, Prefetch('recipes', queryset=recipes,
+                                                to_attr='limited_recipes'))
         serializer = SubscriptionSerializer(page, many=True,
                                             context={'request': request})
         return self.get_paginated_response(serializer.data)
@@ -61,59 +88,154 @@ class UserViewSet(DjoserUserViewSet):
                         status=status.HTTP_400_BAD_REQUEST)
 
 
-class TagViewSet(mixins.RetrieveModelMixin, mixins.ListModelMixin,
-                 viewsets.GenericViewSet):
+class ReferenceViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Чтение справочника из снимка в памяти процесса.
+    Список отдается заранее отрендеренным JSON, запросов к базе нет.
+    """
+
+    permission_classes = (permissions.AllowAny,)
+    pagination_class = None
+    collection = None
+    version = None
+
+    def list(self, request, *args, **kwargs):
+        return conditional_response(request, (self.version,),
+                                    self.list_response, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return conditional_response(request, (self.version,),
+                                    self.retrieve_response, *args, **kwargs)
+
+    def list_response(self, request, *args, **kwargs):
+        data = reference.get()
+        if isinstance(request.accepted_renderer, JSONRenderer):
+            return HttpResponse(
+                getattr(data, self.collection + '_json'),
+                content_type=request.accepted_renderer.media_type)
+        return Response(self.get_serializer(getattr(data, self.collection),
+                                            many=True).data)
+
+    def retrieve_response(self, request, pk, *args, **kwargs):
+        items = getattr(reference.get(), self.collection + '_by_id')
+        item = items.get(int(pk)) if pk.isdigit() else None
+        if item is None:
+            raise Http404
+        return Response(self.get_serializer(item).data)
+
+
+class TagViewSet(ReferenceViewSet):
     """ Получение тегов. """
 
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
-    permission_classes = (permissions.AllowAny,)
-    pagination_class = None
     http_method_names = ('get',)
+    collection = 'tags'
+    version = TAGS_VERSION
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(ReferenceViewSet):
     """ Получение списка ингридиентов. """
 
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
-    permission_classes = (permissions.AllowAny,)
     filter_backends = (DjangoFilterBackend,)
     filterset_class = IngredientFilter
-    pagination_class = None
+    collection = 'ingredients'
+    version = INGREDIENTS_VERSION
+
+    def list_response(self, request, *args, **kwargs):
+        name = request.query_params.get('name')
+        if not name:
+            return super().list_response(request, *args, **kwargs)
+        serializer = self.get_serializer(
+            reference.get().search_ingredients(name), many=True)
+        return Response(serializer.data)
 
 
 class RecipeViewSet(viewsets.ModelViewSet):
     """ Вьюсет для работы с рецептами. """
 
-    queryset = Recipe.objects.all().select_related(
-        'author').prefetch_related('tags', 'ingredients')
+    queryset = Recipe.objects.with_related()
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
     permission_classes = (IsAuthorOrReadOnly,)
 
+    @property
+    def pagination_class(self):
+        request = getattr(self, 'request', None)
+        if (request is not None and request.query_params.get(
+                PAGINATION_QUERY_PARAM) == CURSOR_PAGINATION):
+            return RecipeCursorPagination
+        return api_settings.DEFAULT_PAGINATION_CLASS
+
     def get_queryset(self):
         user = self.request.user
         if user.is_authenticated:
             return self.queryset.annotated(user)
         return self.queryset
 
+    def list(self, request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return cached_response(request, get_versions(RECIPES_VERSION),
+                                   super().list, *args, **kwargs)
+        page = self.paginate_queryset(self.filter_queryset(
+            self.get_queryset()).prefetch_related(None))
+        return self.get_paginated_response(
+            serialize_recipes(page, self.get_serializer_context()))
+
+    def retrieve(self, request, *args, **kwargs):
+        names = (RECIPE_VERSION.format(kwargs['pk']), REFERENCE_VERSION)
+        if request.user.is_authenticated:
+            names += (USER_VERSION.format(request.user.pk),)
+        return conditional_response(request, names, self.retrieve_response,
+                                    *args, **kwargs)
+
+    def retrieve_response(self, request, *args, **kwargs):
+        if request.user.is_authenticated:
+            return super().retrieve(request, *args, **kwargs)
+        versions = get_versions(RECIPE_VERSION.format(kwargs['pk']),
+                                REFERENCE_VERSION)
+        return cached_response(request, versions,
+                               super().retrieve, *args, **kwargs)
+
     def get_serializer_class(self):
         if self.request.method in permissions.SAFE_METHODS:
             return RecipeRetriveSerializer
         return RecipeModifySerializer
 
     @action(detail=False, methods=['get'],
-            permission_classes=(permissions.IsAuthenticated,))
+            permission_classes=(permissions.IsAuthenticated,),
+            renderer_classes=(PDFRenderer, TextRenderer,
+                              CSVRenderer, JSONRenderer))
     def download_shopping_cart(self, request):
-        shopping_list = IngredientRecipe.objects.filter(
-            recipe__shopcart_set__user=request.user).values(
-            'ingredient__name', 'ingredient__measurement_unit').order_by(
-                'ingredient__name').annotate(amount=Sum('amount'))
-        return FileResponse(prepare_pdf_buffer(shopping_list),
-                            as_attachment=True,
-                            filename='shop_cart.pdf',
-                            status=status.HTTP_200_OK)
+        shopping_list = shopping_list_queryset(request.user)
+        if request.accepted_renderer.format != PDFRenderer.format:
+            return shopping_list_stream(shopping_list.iterator(),
+                                        request.accepted_renderer)
+        shopping_list = list(shopping_list)
+        etag = shopping_list_etag(shopping_list)
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = FileResponse(shopping_list_pdf(shopping_list, etag),
+                                    as_attachment=True,
+                                    filename=f'{SHOP_LIST_FILENAME}.pdf',
+                                    status=status.HTTP_200_OK)
+        response['ETag'] = etag
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+    @download_shopping_cart.mapping.post
+    def export_shopping_cart(self, request):
+        serializer = ShoppingListExportSerializer(
+            data={'format': request.accepted_renderer.format})
+        serializer.is_valid(raise_exception=True)
+        export = serializer.save(user=request.user)
+        submit(export_shopping_list, export.pk)
+        return Response(serializer.data, status=status.HTTP_202_ACCEPTED,
+                        headers={'Location': request.build_absolute_uri(
+                            reverse('shopping_list_exports-detail',
+                                    args=(export.pk,)))})
 
     @staticmethod
     def save_method(serializer, pk, request):
@@ -150,3 +272,24 @@ class RecipeViewSet(viewsets.ModelViewSet):
     @favorite.mapping.delete
     def delete_favorite(self, request, pk):
         return self.delete_method(Best, pk, request)
+
+
+class ShoppingListExportViewSet(mixins.RetrieveModelMixin,
+                                viewsets.GenericViewSet):
+    """ Статус фоновой выгрузки и переход к готовому файлу. """
+
+    serializer_class = ShoppingListExportSerializer
+    permission_classes = (permissions.IsAuthenticated,)
+
+    def get_queryset(self):
+        return ShoppingListExport.objects.filter(user=self.request.user)
+
+    def retrieve(self, request, *args, **kwargs):
+        export = self.get_object()
+        if (export.status == ShoppingListExport.Status.PENDING
+                and ShoppingListExport.objects.filter(pk=export.pk).fail_stale(
+                    settings.SHOPPING_LIST_EXPORT_TIMEOUT)):
+            export.status = ShoppingListExport.Status.FAILED
+        if export.status == ShoppingListExport.Status.DONE:
+            return HttpResponseRedirect(export.file.url)
+        return Response(self.get_serializer(export).data)
@@ -0,0 +1,73 @@
+from django.db.backends.postgresql import base
+
+from .pool import get_pool
+
+
+def _ping(connection):
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT 1')
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    Бэкенд PostgreSQL с проверкой постоянных соединений и пулом.
+    CONN_HEALTH_CHECKS проверяет переиспользуемое соединение перед
+    первым запросом в цикле запроса, POOL_SIZE > 0 включает пул
+    соединений процесса вместо открытия нового на каждый запрос.
+    """
+
+    health_check_done = False
+
+    @property
+    def health_check_enabled(self):
+        return self.settings_dict.get('CONN_HEALTH_CHECKS', False)
+
+    @property
+    def pool(self):
+        size = self.settings_dict.get('POOL_SIZE', 0)
+        if not size:
+            return None
+        params = self.get_connection_params()
+        return get_pool(
+            (self.alias, params.get('database')), size,
+            self.settings_dict.get('POOL_TIMEOUT', 10),
+            lambda: super(DatabaseWrapper, self).get_new_connection(params),
+            _ping if self.health_check_enabled else None)
+
+    def get_new_connection(self, conn_params):
+        pool = self.pool
+        if pool is None:
+            return super().get_new_connection(conn_params)
+        connection = pool.acquire()
+        self.isolation_level = self.settings_dict['OPTIONS'].get(
+            'isolation_level', connection.isolation_level)
+        return connection
+
+    def connect(self):
+        super().connect()
+        self.health_check_done = True
+
+    def _close(self):
+        pool = self.pool
+        if pool is None or self.connection is None:
+            return super()._close()
+        with self.wrap_database_errors:
+            if self.errors_occurred:
+                self.connection.close()
+            pool.release(self.connection)
+
+    def close_if_unusable_or_obsolete(self):
+        super().close_if_unusable_or_obsolete()
+        self.health_check_done = False
+
+    def close_if_health_check_failed(self):
+        if (self.connection is None or not self.health_check_enabled
+                or self.health_check_done):
+            return
+        if not self.is_usable():
+            self.close()
+        self.health_check_done = True
+
+    def _cursor(self, name=None):
+        self.close_if_health_check_failed()
+        return super()._cursor(name)
@@ -0,0 +1,110 @@
+from collections import deque
+from threading import BoundedSemaphore, Lock
+from time import monotonic
+
+from psycopg2 import OperationalError
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+
+POOL_TIMEOUT_ERROR = 'Нет свободных соединений с базой за {} с'
+
+pools = {}
+_pools_lock = Lock()
+
+
+class ConnectionPool:
+    """
+    Пул соединений psycopg2 внутри процесса.
+    Ограничивает число одновременно открытых соединений, отдает
+    последнее возвращенное соединение и считает время ожидания.
+    """
+
+    def __init__(self, size, timeout, connect, check=None):
+        self.size = size
+        self.timeout = timeout
+        self._connect = connect
+        self._check = check
+        self._idle = deque()
+        self._lock = Lock()
+        self._slots = BoundedSemaphore(size)
+        self.in_use = 0
+        self.opened = 0
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds = 0.0
+
+    def _usable(self, connection):
+        if connection.closed:
+            return False
+        if self._check is None:
+            return True
+        try:
+            self._check(connection)
+        except Exception:
+            connection.close()
+            return False
+        return True
+
+    def acquire(self):
+        start = monotonic()
+        if not self._slots.acquire(timeout=self.timeout):
+            with self._lock:
+                self.timeouts += 1
+                self.wait_seconds += monotonic() - start
+            raise OperationalError(POOL_TIMEOUT_ERROR.format(self.timeout))
+        with self._lock:
+            self.wait_seconds += monotonic() - start
+            self.checkouts += 1
+            self.in_use += 1
+            connection = self._idle.pop() if self._idle else None
+        try:
+            if connection is None or not self._usable(connection):
+                connection = self._connect()
+                with self._lock:
+                    self.opened += 1
+        except Exception:
+            self._give_back(None)
+            raise
+        return connection
+
+    def release(self, connection):
+        """ Возврат соединения в пул, открытая транзакция откатывается. """
+        if not connection.closed:
+            try:
+                status = connection.get_transaction_status()
+                if status != TRANSACTION_STATUS_IDLE:
+                    connection.rollback()
+            except Exception:
+                connection.close()
+        self._give_back(None if connection.closed else connection)
+
+    def _give_back(self, connection):
+        with self._lock:
+            if connection is not None:
+                self._idle.append(connection)
+            self.in_use -= 1
+        self._slots.release()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': self.size,
+                'in_use': self.in_use,
+                'idle': len(self._idle),
+                'opened': self.opened,
+                'checkouts': self.checkouts,
+                'timeouts': self.timeouts,
+                'wait_seconds': self.wait_seconds,
+            }
+
+
+def get_pool(key, size, timeout, connect, check=None):
+    with _pools_lock:
+        if key not in pools:
+            pools[key] = ConnectionPool(size, timeout, connect, check)
+        return pools[key]
+
+
+def pool_stats():
+    """ Статистика всех пулов процесса по псевдонимам баз. """
+    with _pools_lock:
+        return {key: pool.stats() for key, pool in pools.items()}
@@ -1,4 +1,5 @@
 import os
+import tempfile
 from pathlib import Path
 
 from dotenv import load_dotenv
@@ -34,6 +35,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -49,9 +51,9 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticated',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ],
-    'DEFAULT_PAGINATION_CLASS': 'api.paginations.PageWithLimitPagination',
+    'DEFAULT_PAGINATION_CLASS': 'api.paginations.CachedCountPagination',
     'PAGE_SIZE': 6,
     'DEFAULT_FILTER_BACKENDS': [
         'django_filters.rest_framework.DjangoFilterBackend',
@@ -102,17 +104,75 @@ if os.getenv('USE_SQLITE', 'True') == 'True':
         }
     }
 else:
+    DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 0))
     DATABASES = {
         'default': {
-            'ENGINE': 'django.db.backends.postgresql',
+            'ENGINE': 'foodgramm_backend.postgresql',
             'NAME': os.getenv('POSTGRES_DB', 'django'),
             'USER': os.getenv('POSTGRES_USER', 'django'),
             'PASSWORD': os.getenv('POSTGRES_PASSWORD', ''),
             'HOST': os.getenv('DB_HOST', ''),
-            'PORT': os.getenv('DB_PORT', 5432)
+            'PORT': os.getenv('DB_PORT', 5432),
+            'CONN_MAX_AGE': (0 if DB_POOL_SIZE
+                             else int(os.getenv('DB_CONN_MAX_AGE', 60))),
+            'CONN_HEALTH_CHECKS': os.getenv('DB_CONN_HEALTH_CHECKS',
+                                            'True') == 'True',
+            'POOL_SIZE': DB_POOL_SIZE,
+            'POOL_TIMEOUT': float(os.getenv('DB_POOL_TIMEOUT', 10)),
         }
     }
 
+CACHE_BACKEND = os.getenv('CACHE_BACKEND',
+                          'django.core.cache.backends.locmem.LocMemCache')
+
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', 5000)),
+        },
+    },
+    'recipe_bodies': {
+        'BACKEND': os.getenv('RECIPE_BODY_CACHE_BACKEND', CACHE_BACKEND),
+        'LOCATION': os.getenv('RECIPE_BODY_CACHE_LOCATION', 'recipe_bodies'),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('RECIPE_BODY_CACHE_ENTRIES', 20000)),
+        },
+    },
+    'shopping_lists': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.getenv('SHOPPING_LIST_CACHE_DIR', os.path.join(
+            tempfile.gettempdir(), 'foodgramm_shopping_lists')),
+        'TIMEOUT': int(os.getenv('SHOPPING_LIST_CACHE_TIMEOUT', 60 * 60 * 24)),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('SHOPPING_LIST_CACHE_ENTRIES', 500)),
+        },
+    },
+}
+
+BACKGROUND_WORKERS = int(os.getenv('BACKGROUND_WORKERS', 2))
+SHOPPING_LIST_EXPORT_TIMEOUT = int(
+    os.getenv('SHOPPING_LIST_EXPORT_TIMEOUT', 10 * 60))
+SHOPPING_LIST_EXPORT_TTL = int(
+    os.getenv('SHOPPING_LIST_EXPORT_TTL', 60 * 60 * 24))
+
+ASYNC_READ_VIEWS = os.getenv('ASYNC_READ_VIEWS', 'False') == 'True'
+
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+QUERY_BUDGET_STRICT = os.getenv('QUERY_BUDGET_STRICT', 'False') == 'True'
+# Число запросов при пустом кеше: токен, снимок справочников, выборка
+# и предзагрузки. Для ленты учтены фильтр по автору и оценка числа
+# записей из pg_class в PostgreSQL.
+QUERY_BUDGETS = {
+    'GET recipes-list': 10,
+    'GET recipes-detail': 7,
+    'GET recipes-download-shopping-cart': 2,
+    'GET users-subscriptions': 5,
+    'GET tags-list': 3,
+    'GET ingredients-list': 3,
+}
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
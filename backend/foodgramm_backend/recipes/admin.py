@@ -1,6 +1,8 @@
 from django.contrib import admin
 from django.utils.safestring import mark_safe
 
+from api.tasks import make_recipe_renditions, recipe_image_names, submit
+
 from .models import (Recipe, Ingredient, Tag,
                      ShopCart, Best, IngredientRecipe)
 
@@ -22,8 +24,22 @@ class RecipeAdmin(admin.ModelAdmin):
 
     @admin.display(description='Картинка')
     def recipe_image(self, obj):
-        return mark_safe(f'<img src={obj.image.url} width="80" height="60">'
-                         ) if obj.image else None
+        image = obj.image_thumbnail or obj.image
+        return mark_safe(f'<img src={image.url} width="80" height="60">'
+                         ) if image else None
+
+    def save_model(self, request, obj, form, change):
+        image_changed = 'image' in form.changed_data
+        old_names = []
+        if image_changed:
+            if change:
+                old_names = recipe_image_names(
+                    Recipe.objects.get(pk=obj.pk))
+            obj.image_preview = obj.image_thumbnail = None
+        super().save_model(request, obj, form, change)
+        if image_changed and obj.image:
+            submit(make_recipe_renditions, obj.pk, obj.image.name,
+                   old_names)
 
     @admin.display(description='Ингредиенты')
     def ingr(self, obj):
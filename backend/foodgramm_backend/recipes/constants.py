@@ -7,6 +7,9 @@ MIN_COOKING_VALUE = 1
 COOKING_VALIDATION_MESSAGE = 'Введите значение в диапазоне от 1  до 300 минут'
 MIN_INGREDIENT_VALUE = 1
 INGREDIENT_VALIDATION_MESSAGE = 'Выберите от 1 до 64 ингредиентов'
+MAX_EXPORT_FORMAT_CHARACTERS = 4
+MAX_EXPORT_STATUS_CHARACTERS = 16
+SHOP_LIST_UPDATE_BATCH = 500
 UNIQUE_CONSTRANT = 'Запись {} в модели {} неуникальна'
 
 BEGIN_LOAD = 'Начинаю загрузку '
@@ -14,3 +17,32 @@ LOAD_DONE = 'Импорт завершен для модели {}. Всего {}
 INGREDIENTS_CSV_PATH = 'data/ingredients.csv'
 TAGS_CSV_PATH = 'data/tags.csv'
 CSV_LOAD_ERROR = 'Ошибка при загрузке данных из файла {}: {}'
+SHOP_LIST_REBUILT = 'Таблица списков покупок пересобрана: {} позиций.'
+SHOP_LIST_VERIFIED = 'Таблица списков покупок совпадает с корзинами.'
+SHOP_LIST_MISMATCH = ('Расхождение для пользователя {}, ингредиента {}: '
+                      'в таблице {}, по корзинам {}')
+SHOP_LIST_MISMATCH_ERROR = 'Найдено расхождений: {}'
+
+SYNTHETIC_USERNAME = 'synthetic_{}'
+SYNTHETIC_EMAIL = 'synthetic_{}@example.com'
+SYNTHETIC_PASSWORD = 'synthetic-password'
+SYNTHETIC_RECIPE_NAME = 'Рецепт {} №{}'
+SYNTHETIC_RECIPE_TEXT = 'Синтетический рецепт для нагрузочных замеров.'
+SYNTHETIC_MAX_AMOUNT = 500
+SYNTHETIC_MAX_COOKING_TIME = 180
+SYNTHETIC_DATA_CREATED = ('Создано пользователей: {}, рецептов: {}, '
+                          'подписок: {}, избранного: {}, в корзинах: {}.')
+
+BENCHMARK_PERCENTILES = (50, 90, 95, 99)
+BENCHMARK_IMAGE_SIZE = (64, 64)
+BENCHMARK_SIZE = 'Набор данных: пользователей {}, рецептов {}.'
+BENCHMARK_WARM = 'warm'
+BENCHMARK_COLD = 'cold'
+BENCHMARK_RESULT = ('{:<28} {:<4}  p50 {:>8.2f} мс  p95 {:>8.2f} мс  '
+                    'SQL-запросов {}–{}')
+BENCHMARK_REQUEST_ERROR = '{} {} вернул статус {}: {}'
+BENCHMARK_REPORT_SAVED = 'Отчет сохранен в {}'
+
+RENDITIONS_DONE = 'Уменьшенные копии созданы для рецептов: {}, ошибок: {}.'
+RENDITION_ERROR = 'Не удалось обработать фото рецепта {}: {}'
+EXPORTS_CLEANED = 'Удалено выгрузок: {}, помечено ошибочными: {}.'
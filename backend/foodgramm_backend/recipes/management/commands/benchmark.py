@@ -0,0 +1,243 @@
+import base64
+import json
+import platform
+import shutil
+from io import BytesIO
+from math import ceil
+from random import Random
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+import django
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from PIL import Image
+from rest_framework.authtoken.models import Token
+
+from api.constants import SHOP_LIST_IMAGE
+from api.tasks import executor
+from recipes.models import Best, Ingredient, Recipe, ShopCart, Tag, User
+from recipes.constants import (SYNTHETIC_USERNAME, BENCHMARK_PERCENTILES,
+                               BENCHMARK_IMAGE_SIZE, BENCHMARK_SIZE,
+                               BENCHMARK_RESULT, BENCHMARK_REQUEST_ERROR,
+                               BENCHMARK_REPORT_SAVED, BENCHMARK_WARM,
+                               BENCHMARK_COLD)
+from users.models import Follow
+
+
+def percentile(values, percent):
+    """ Процентиль по ближайшему рангу для отсортированного списка. """
+    return values[max(ceil(len(values) * percent / 100) - 1, 0)]
+
+
+def summary(latencies, queries):
+    latencies = sorted(seconds * 1000 for seconds in latencies)
+    return {
+        'latency_ms': {
+            **{f'p{percent}': round(percentile(latencies, percent), 3)
+               for percent in BENCHMARK_PERCENTILES},
+            'mean': round(sum(latencies) / len(latencies), 3),
+            'max': round(latencies[-1], 3),
+        },
+        'queries': {
+            'min': min(queries),
+            'max': max(queries),
+            'mean': round(sum(queries) / len(queries), 2),
+        },
+    }
+
+
+def png_data_uri():
+    buffer = BytesIO()
+    Image.new('RGB', BENCHMARK_IMAGE_SIZE, 'orange').save(buffer, 'PNG')
+    return ('data:image/png;base64,'
+            + base64.b64encode(buffer.getvalue()).decode())
+
+
+class Command(BaseCommand):
+    """
+    Замер задержек и числа SQL-запросов горячих эндпоинтов API
+    на синтетических данных нескольких размеров. GET-запросы
+    замеряются с прогретым (warm) и очищенным (cold) кешем. Данные
+    создаются в тестовой базе, кеши и медиафайлы на время замера
+    подменяются временными, результат сохраняется в JSON.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+',
+                            default=[10, 100],
+                            help='Число пользователей в наборах данных.')
+        parser.add_argument('--requests', type=int, default=30,
+                            help='Замеров на эндпоинт.')
+        parser.add_argument('--warmup', type=int, default=2,
+                            help='Запросов на прогрев, не входят в замер.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', default='benchmark.json')
+
+    def handle(self, *args, **options):
+        with TemporaryDirectory() as directory:
+            shutil.copy(settings.MEDIA_ROOT / SHOP_LIST_IMAGE, directory)
+            test_settings = connection.settings_dict['TEST']
+            if connection.vendor == 'sqlite' and not test_settings['NAME']:
+                test_settings['NAME'] = f'{directory}/benchmark.sqlite3'
+            database = connection.creation.create_test_db(
+                verbosity=0, autoclobber=True, serialize=False)
+            try:
+                with override_settings(
+                        ALLOWED_HOSTS=['testserver'], MEDIA_ROOT=directory,
+                        CACHES={alias: {
+                            'BACKEND': 'django.core.cache.backends.locmem.'
+                                       'LocMemCache',
+                            'LOCATION': f'benchmark-{alias}'}
+                            for alias in settings.CACHES}):
+                    report = self.run(**options)
+                    executor.shutdown(wait=True)
+            finally:
+                connection.creation.destroy_test_db(database, verbosity=0)
+        with open(options['output'], 'w', encoding='utf-8') as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+        self.stdout.write(BENCHMARK_REPORT_SAVED.format(options['output']))
+
+    def run(self, sizes, requests, warmup, seed, **options):
+        report = {
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'requests': requests,
+            'warmup': warmup,
+            'seed': seed,
+            'sizes': [],
+        }
+        created = 0
+        for size in sorted(sizes):
+            if size > created:
+                call_command('generate_data', users=size - created,
+                             seed=seed, stdout=self.stdout)
+                created = size
+            data = {
+                'users': User.objects.count(),
+                'recipes': Recipe.objects.count(),
+                'follows': Follow.objects.count(),
+                'favorites': Best.objects.count(),
+                'cart': ShopCart.objects.count(),
+            }
+            self.stdout.write(BENCHMARK_SIZE.format(data['users'],
+                                                    data['recipes']))
+            data['endpoints'] = {}
+            for name, client, method, path, body in self.scenarios(
+                    Random(seed), size):
+                result = data['endpoints'][name] = {'method': method.upper()}
+                for cold in (False, True) if method == 'get' else (False,):
+                    result[BENCHMARK_COLD if cold else BENCHMARK_WARM] = (
+                        self.measure(name, requests, warmup, client, method,
+                                     path, body, cold))
+            report['sizes'].append(data)
+        return report
+
+    def measure(self, name, requests, warmup, client, method, path, body,
+                cold=False):
+        """
+        Замер одного эндпоинта. В холодном варианте перед каждым
+        запросом очищаются все кеши, включая версии и готовые PDF.
+        """
+        latencies, queries = [], []
+        for number in range(warmup + requests):
+            url, data = path(), body() if body else None
+            if cold:
+                for cache in caches.all():
+                    cache.clear()
+            with CaptureQueriesContext(connection) as context:
+                start = perf_counter()
+                if data is None:
+                    response = getattr(client, method)(url)
+                else:
+                    response = getattr(client, method)(
+                        url, data, content_type='application/json')
+                if response.streaming:
+                    b''.join(response.streaming_content)
+                seconds = perf_counter() - start
+            response.close()
+            if response.status_code >= 400:
+                raise CommandError(BENCHMARK_REQUEST_ERROR.format(
+                    method.upper(), url, response.status_code,
+                    response.content[:200]))
+            if number >= warmup:
+                latencies.append(seconds)
+                queries.append(len(context.captured_queries))
+        result = summary(latencies, queries)
+        self.stdout.write(BENCHMARK_RESULT.format(
+            name, BENCHMARK_COLD if cold else BENCHMARK_WARM,
+            result['latency_ms']['p50'], result['latency_ms']['p95'],
+            result['queries']['min'], result['queries']['max']))
+        return result
+
+    def scenarios(self, random, size):
+        """ (имя, клиент, метод, адрес, тело запроса) для каждого замера. """
+        reader = User.objects.filter(
+            username__startswith=SYNTHETIC_USERNAME.format('')).first()
+        authorized = Client(HTTP_AUTHORIZATION='Token {}'.format(
+            Token.objects.get_or_create(user=reader)[0].key))
+        anonymous = Client()
+        recipe_ids = list(Recipe.objects.values_list('id', flat=True))
+        author_ids = list(Recipe.objects.values_list(
+            'author_id', flat=True).distinct())
+        tags = dict(Tag.objects.values_list('slug', 'id'))
+        ingredient_ids = list(Ingredient.objects.values_list('id', flat=True))
+        pages = ceil(len(recipe_ids) / settings.REST_FRAMEWORK['PAGE_SIZE'])
+        image = png_data_uri()
+        names = iter(range(1, 1 << 31))
+        own_recipe = Recipe.objects.filter(author=reader).first()
+
+        def recipe_body(with_image=False):
+            body = {
+                'name': f'Замер {size}-{next(names)}',
+                'text': 'Замер',
+                'cooking_time': random.randint(1, 60),
+                'tags': random.sample(list(tags.values()), 2),
+                'ingredients': [
+                    {'id': ingredient_id, 'amount': random.randint(1, 500)}
+                    for ingredient_id in random.sample(ingredient_ids, 8)],
+            }
+            if with_image:
+                body['image'] = image
+            return body
+
+        def page():
+            return f'/api/recipes/?page={random.randint(1, pages)}'
+
+        return (
+            ('recipes_list_anonymous', anonymous, 'get', page, None),
+            ('recipes_list', authorized, 'get', page, None),
+            ('recipes_list_cursor', authorized, 'get',
+             lambda: '/api/recipes/?pagination=cursor', None),
+            ('recipe_detail', authorized, 'get',
+             lambda: f'/api/recipes/{random.choice(recipe_ids)}/', None),
+            ('recipes_filter_tags', authorized, 'get',
+             lambda: '/api/recipes/?' + '&'.join(
+                 f'tags={slug}' for slug in random.sample(list(tags), 2)),
+             None),
+            ('recipes_filter_author', authorized, 'get',
+             lambda: f'/api/recipes/?author={random.choice(author_ids)}',
+             None),
+            ('recipes_filter_favorited', authorized, 'get',
+             lambda: '/api/recipes/?is_favorited=1', None),
+            ('recipes_filter_shopping_cart', authorized, 'get',
+             lambda: '/api/recipes/?is_in_shopping_cart=1', None),
+            ('subscriptions', authorized, 'get',
+             lambda: '/api/users/subscriptions/?recipes_limit=3', None),
+            ('recipe_create', authorized, 'post', lambda: '/api/recipes/',
+             lambda: recipe_body(with_image=True)),
+            ('recipe_update', authorized, 'patch',
+             lambda: f'/api/recipes/{own_recipe.id}/', recipe_body),
+            ('shopping_cart_txt', authorized, 'get',
+             lambda: '/api/recipes/download_shopping_cart/?format=txt',
+             None),
+            ('shopping_cart_pdf', authorized, 'get',
+             lambda: '/api/recipes/download_shopping_cart/?format=pdf',
+             None),
+        )
@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from recipes.models import ShoppingListExport
+from recipes.constants import EXPORTS_CLEANED
+
+
+class Command(BaseCommand):
+    """
+    Удаление выгрузок списков покупок старше SHOPPING_LIST_EXPORT_TTL
+    вместе с файлами и пометка зависших заданий ошибочными.
+    Запускается по расписанию.
+    """
+
+    def handle(self, *args, **options):
+        failed = ShoppingListExport.objects.fail_stale(
+            settings.SHOPPING_LIST_EXPORT_TIMEOUT)
+        deleted = 0
+        for export in ShoppingListExport.objects.older_than(
+                settings.SHOPPING_LIST_EXPORT_TTL).iterator():
+            if export.file:
+                export.file.delete(save=False)
+            export.delete()
+            deleted += 1
+        self.stdout.write(EXPORTS_CLEANED.format(deleted, failed))
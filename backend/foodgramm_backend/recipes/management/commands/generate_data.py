@@ -0,0 +1,120 @@
+from random import Random
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+
+from api.constants import RECIPES_VERSION
+from api.signals import table_version
+from api.versions import bump_versions
+from recipes.models import (Best, Ingredient, IngredientRecipe, Recipe,
+                            ShopCart, Tag, User)
+from recipes.constants import (SYNTHETIC_USERNAME, SYNTHETIC_EMAIL,
+                               SYNTHETIC_PASSWORD, SYNTHETIC_RECIPE_NAME,
+                               SYNTHETIC_RECIPE_TEXT, SYNTHETIC_MAX_AMOUNT,
+                               SYNTHETIC_MAX_COOKING_TIME,
+                               SYNTHETIC_DATA_CREATED)
+from users.models import Follow
+
+
+def last_id(model):
+    return model.objects.aggregate(last=Max('id'))['last'] or 0
+
+
+class Command(BaseCommand):
+    """
+    Синтетические пользователи, рецепты, подписки, избранное и корзины
+    поверх ингредиентов и тегов из data/. Повторный запуск добавляет
+    новых пользователей к уже созданным.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100,
+                            help='Сколько пользователей создать.')
+        parser.add_argument('--recipes-per-user', type=int, default=5)
+        parser.add_argument('--ingredients-per-recipe', type=int, default=8)
+        parser.add_argument('--tags-per-recipe', type=int, default=2)
+        parser.add_argument('--follows-per-user', type=int, default=10)
+        parser.add_argument('--favorites-per-user', type=int, default=20)
+        parser.add_argument('--cart-per-user', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if not Ingredient.objects.exists():
+            call_command('bulk_load', stdout=self.stdout)
+        with transaction.atomic():
+            counts = self.generate(**options)
+        bump_versions(RECIPES_VERSION, table_version(Recipe),
+                      table_version(User))
+        call_command('rebuild_shop_list', stdout=self.stdout)
+        self.stdout.write(SYNTHETIC_DATA_CREATED.format(*counts))
+
+    def generate(self, users, recipes_per_user, ingredients_per_recipe,
+                 tags_per_recipe, follows_per_user, favorites_per_user,
+                 cart_per_user, seed, batch_size, **options):
+        start = User.objects.filter(
+            username__startswith=SYNTHETIC_USERNAME.format('')).count()
+        random = Random(seed + start)
+        ingredient_ids = list(Ingredient.objects.values_list('id', flat=True))
+        tag_ids = list(Tag.objects.values_list('id', flat=True))
+        password = make_password(SYNTHETIC_PASSWORD)
+
+        first_user = last_id(User)
+        User.objects.bulk_create(
+            (User(username=SYNTHETIC_USERNAME.format(number),
+                  email=SYNTHETIC_EMAIL.format(number),
+                  first_name=SYNTHETIC_USERNAME.format(number),
+                  last_name=SYNTHETIC_USERNAME.format(number),
+                  password=password)
+             for number in range(start, start + users)),
+            batch_size=batch_size)
+        user_ids = list(User.objects.filter(
+            id__gt=first_user).values_list('id', flat=True))
+
+        first_recipe = last_id(Recipe)
+        Recipe.objects.bulk_create(
+            (Recipe(author_id=user_id,
+                    name=SYNTHETIC_RECIPE_NAME.format(user_id, number),
+                    text=SYNTHETIC_RECIPE_TEXT,
+                    cooking_time=random.randint(
+                        1, SYNTHETIC_MAX_COOKING_TIME))
+             for user_id in user_ids for number in range(recipes_per_user)),
+            batch_size=batch_size)
+        recipe_ids = list(Recipe.objects.filter(
+            id__gt=first_recipe).values_list('id', flat=True))
+        IngredientRecipe.objects.bulk_create(
+            (IngredientRecipe(recipe_id=recipe_id, ingredient_id=ingredient_id,
+                              amount=random.randint(1, SYNTHETIC_MAX_AMOUNT))
+             for recipe_id in recipe_ids
+             for ingredient_id in random.sample(
+                 ingredient_ids,
+                 min(ingredients_per_recipe, len(ingredient_ids)))),
+            batch_size=batch_size)
+        Recipe.tags.through.objects.bulk_create(
+            (Recipe.tags.through(recipe_id=recipe_id, tag_id=tag_id)
+             for recipe_id in recipe_ids
+             for tag_id in random.sample(
+                 tag_ids, min(tags_per_recipe, len(tag_ids)))),
+            batch_size=batch_size)
+
+        all_users = list(User.objects.filter(
+            username__startswith=SYNTHETIC_USERNAME.format('')
+        ).values_list('id', flat=True))
+        all_recipes = list(Recipe.objects.values_list('id', flat=True))
+        created = []
+        for model, field, population, per_user in (
+                (Follow, 'author_id', all_users, follows_per_user),
+                (Best, 'recipe_id', all_recipes, favorites_per_user),
+                (ShopCart, 'recipe_id', all_recipes, cart_per_user)):
+            rows = [model(user_id=user_id, **{field: value})
+                    for user_id in user_ids
+                    for value in random.sample(
+                        population, min(per_user, len(population)))
+                    if (field, value) != ('author_id', user_id)]
+            model.objects.bulk_create(rows, batch_size=batch_size,
+                                      ignore_conflicts=True)
+            created.append(len(rows))
+        return (len(user_ids), len(recipe_ids), *created)
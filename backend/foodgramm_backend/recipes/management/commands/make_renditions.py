@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from api.tasks import make_recipe_renditions
+from recipes.models import Recipe
+from recipes.constants import RENDITIONS_DONE, RENDITION_ERROR
+
+
+class Command(BaseCommand):
+    """ Уменьшенные копии фото для рецептов, у которых их еще нет. """
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.filter(
+            Q(image_preview__isnull=True) | Q(image_preview='')
+        ).exclude(Q(image__isnull=True) | Q(image='')).values_list(
+            'pk', 'image')
+        done = failed = 0
+        for recipe_id, image_name in recipes.iterator():
+            try:
+                make_recipe_renditions(recipe_id, image_name)
+            except Exception as error:
+                failed += 1
+                self.stdout.write(RENDITION_ERROR.format(recipe_id, error))
+            else:
+                done += 1
+        self.stdout.write(RENDITIONS_DONE.format(done, failed))
@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from recipes.models import ShopListItem
+from recipes.constants import (SHOP_LIST_REBUILT, SHOP_LIST_VERIFIED,
+                               SHOP_LIST_MISMATCH, SHOP_LIST_MISMATCH_ERROR)
+
+
+class Command(BaseCommand):
+    """ Пересборка и проверка таблицы списков покупок. """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verify-only', action='store_true',
+                            help='Только сверить таблицу с корзинами.')
+
+    def rebuild(self):
+        with transaction.atomic():
+            ShopListItem.objects.all().delete()
+            items = ShopListItem.objects.bulk_create(
+                ShopListItem(user_id=user_id, ingredient_id=ingredient_id,
+                             amount=amount)
+                for (user_id, ingredient_id), amount
+                in ShopListItem.objects.expected().items())
+        self.stdout.write(SHOP_LIST_REBUILT.format(len(items)))
+
+    def verify(self):
+        expected = ShopListItem.objects.expected()
+        actual = {(user_id, ingredient_id): amount
+                  for user_id, ingredient_id, amount
+                  in ShopListItem.objects.values_list(
+                      'user_id', 'ingredient_id', 'amount')}
+        mismatches = 0
+        for user_id, ingredient_id in expected.keys() | actual.keys():
+            stored = actual.get((user_id, ingredient_id))
+            calculated = expected.get((user_id, ingredient_id))
+            if stored != calculated:
+                mismatches += 1
+                self.stdout.write(SHOP_LIST_MISMATCH.format(
+                    user_id, ingredient_id, stored, calculated))
+        if mismatches:
+            raise CommandError(SHOP_LIST_MISMATCH_ERROR.format(mismatches))
+        self.stdout.write(SHOP_LIST_VERIFIED)
+
+    def handle(self, *args, **options):
+        if not options['verify_only']:
+            self.rebuild()
+        self.verify()
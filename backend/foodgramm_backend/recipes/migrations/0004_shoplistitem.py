@@ -0,0 +1,48 @@
+# Generated by Django 3.2.16 on 2026-10-17 04:23
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_shop_list(apps, schema_editor):
+    IngredientRecipe = apps.get_model('recipes', 'IngredientRecipe')
+    ShopListItem = apps.get_model('recipes', 'ShopListItem')
+    rows = IngredientRecipe.objects.filter(
+        recipe__shopcart_set__isnull=False).values(
+        'recipe__shopcart_set__user', 'ingredient').order_by().annotate(
+        amount=models.Sum('amount'))
+    ShopListItem.objects.bulk_create(
+        ShopListItem(user_id=row['recipe__shopcart_set__user'],
+                     ingredient_id=row['ingredient'],
+                     amount=row['amount'])
+        for row in rows)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0003_shoppinglistexport'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShopListItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.PositiveIntegerField(verbose_name='Количество')),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shop_list_items', to='recipes.ingredient')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shop_list_items', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Позиция списка покупок',
+                'verbose_name_plural': 'Позиции списков покупок',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='shoplistitem',
+            constraint=models.UniqueConstraint(fields=('user', 'ingredient'), name='unique_shop_list_item'),
+        ),
+        migrations.RunPython(fill_shop_list, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.2.16 on 2026-10-17 04:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0005_recipe_pub_date_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='image_preview',
+            field=models.ImageField(default=None, editable=False, null=True, upload_to='recipe/previews/', verbose_name='Превью'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='image_thumbnail',
+            field=models.ImageField(default=None, editable=False, null=True, upload_to='recipe/thumbnails/', verbose_name='Миниатюра'),
+        ),
+    ]
@@ -1,11 +1,20 @@
+from collections import defaultdict
+from datetime import timedelta
+from uuid import uuid4
+
 from colorfield.fields import ColorField
 from django.core.validators import MinValueValidator, MaxValueValidator
-from django.db import models
+from django.db import models, transaction
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Greatest, RowNumber
+from django.utils import timezone
 
 from .constants import (MAX_NAME_CHARACTERS, MAX_COLOR_CHARACTERS,
                         MAX_SLUG_CHARACTERS, MIN_COOKING_VALUE,
                         COOKING_VALIDATION_MESSAGE, MIN_INGREDIENT_VALUE,
-                        INGREDIENT_VALIDATION_MESSAGE, MAX_SMALL_INTEGER)
+                        INGREDIENT_VALIDATION_MESSAGE, MAX_SMALL_INTEGER,
+                        MAX_EXPORT_FORMAT_CHARACTERS,
+                        MAX_EXPORT_STATUS_CHARACTERS, SHOP_LIST_UPDATE_BATCH)
 
 from users.models import User
 
@@ -48,6 +57,33 @@ class Ingredient(models.Model):
 
 
 class RecipeQuerySet(models.QuerySet):
+    @staticmethod
+    def related_lookups():
+        return ('tags', models.Prefetch(
+            'ingredientrecipe',
+            queryset=IngredientRecipe.objects.select_related('ingredient')))
+
+    def with_related(self):
+        return self.select_related('author').prefetch_related(
+            *self.related_lookups())
+
+    def latest_per_author(self, author_ids, limit):
+        """
+        Не более limit последних рецептов каждого из авторов.
+        При равной дате публикации новее рецепт с большим id.
+        """
+        ranked = self.filter(author_id__in=author_ids).annotate(
+            author_rank=models.Window(
+                expression=RowNumber(),
+                partition_by=models.F('author_id'),
+                order_by=(models.F('pub_date').desc(),
+                          models.F('id').desc()))
+        ).order_by().values('pk', 'author_rank')
+        sql, params = ranked.query.sql_with_params()
+        return self.filter(pk__in=RawSQL(
+            f'SELECT id FROM ({sql}) ranked WHERE author_rank <= %s',
+            (*params, limit)))
+
     def annotated(self, user):
         is_favorited = Best.objects.all().filter(
             recipe__pk=models.OuterRef('pk'), user=user)
@@ -68,6 +104,12 @@ class Recipe(models.Model):
     tags = models.ManyToManyField(Tag, related_name='recipes')
     image = models.ImageField('Фото', upload_to='recipe/images/',
                               null=True, default=None)
+    image_preview = models.ImageField('Превью', upload_to='recipe/previews/',
+                                      null=True, default=None, editable=False)
+    image_thumbnail = models.ImageField('Миниатюра',
+                                        upload_to='recipe/thumbnails/',
+                                        null=True, default=None,
+                                        editable=False)
     name = models.CharField('Название', max_length=MAX_NAME_CHARACTERS)
     text = models.TextField('Описание')
     cooking_time = models.PositiveSmallIntegerField(
@@ -87,6 +129,9 @@ class Recipe(models.Model):
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ('-pub_date',)
+        indexes = (
+            models.Index(fields=('-pub_date', '-id'),
+                         name='recipe_pub_date_id_idx'),)
         constraints = (
             models.UniqueConstraint(
                 fields=('name', 'author'),
@@ -154,3 +199,157 @@ class ShopCart(ShopCartBestBaseModel):
         verbose_name = 'Список покупок'
         verbose_name_plural = 'Списки покупок'
         default_related_name = 'shopcart_set'
+
+
+class ShopListItemQuerySet(models.QuerySet):
+    @transaction.atomic
+    def apply_changes(self, changes):
+        """
+        Применяет изменения {(user_id, ingredient_id): delta} к спискам.
+        Недостающие строки вставляются без конфликтов, количество
+        меняется через F(), поэтому параллельные изменения одной позиции
+        складываются. Пользователи с одинаковым набором изменений
+        обновляются одним UPDATE на пачку из SHOP_LIST_UPDATE_BATCH
+        пользователей. Строки с нулевым количеством удаляются.
+        """
+        changes = {key: delta for key, delta in changes.items() if delta}
+        if not changes:
+            return
+        self.bulk_create(
+            (self.model(user_id=user_id, ingredient_id=ingredient_id,
+                        amount=0)
+             for (user_id, ingredient_id), delta in changes.items()
+             if delta > 0),
+            ignore_conflicts=True)
+        user_deltas = defaultdict(dict)
+        for (user_id, ingredient_id), delta in changes.items():
+            user_deltas[user_id][ingredient_id] = delta
+        users = defaultdict(list)
+        for user_id, deltas in user_deltas.items():
+            users[tuple(sorted(deltas.items()))].append(user_id)
+        for deltas, user_ids in users.items():
+            amount = Greatest(models.F('amount') + models.Case(
+                *(models.When(ingredient_id=ingredient_id,
+                              then=models.Value(delta))
+                  for ingredient_id, delta in deltas),
+                default=models.Value(0),
+                output_field=models.IntegerField()), models.Value(0))
+            for start in range(0, len(user_ids), SHOP_LIST_UPDATE_BATCH):
+                items = self.filter(
+                    user_id__in=user_ids[start:start + SHOP_LIST_UPDATE_BATCH],
+                    ingredient_id__in=[ingredient_id
+                                       for ingredient_id, _ in deltas])
+                items.update(amount=amount)
+                if any(delta < 0 for _, delta in deltas):
+                    items.filter(amount=0).delete()
+
+    def add_recipe(self, user_id, recipe_id, sign=1):
+        self.apply_changes({
+            (user_id, ingredient_id): sign * amount
+            for ingredient_id, amount in IngredientRecipe.objects.filter(
+                recipe_id=recipe_id).values_list('ingredient_id', 'amount')
+        })
+
+    def remove_recipe(self, user_id, recipe_id):
+        self.add_recipe(user_id, recipe_id, sign=-1)
+
+    def change_recipe(self, recipe, old_amounts, new_amounts):
+        """
+        Переносит изменение ингредиентов рецепта в списки всех
+        пользователей, у которых рецепт лежит в корзине.
+        """
+        deltas = {
+            ingredient_id: (new_amounts.get(ingredient_id, 0)
+                            - old_amounts.get(ingredient_id, 0))
+            for ingredient_id in old_amounts.keys() | new_amounts.keys()
+        }
+        deltas = {ingredient_id: delta
+                  for ingredient_id, delta in deltas.items() if delta}
+        if not deltas:
+            return
+        self.apply_changes({
+            (user_id, ingredient_id): delta
+            for user_id in ShopCart.objects.filter(
+                recipe=recipe).values_list('user_id', flat=True)
+            for ingredient_id, delta in deltas.items()
+        })
+
+    def expected(self):
+        """ Содержимое таблицы, рассчитанное заново по корзинам. """
+        rows = IngredientRecipe.objects.filter(
+            recipe__shopcart_set__isnull=False).values(
+            'recipe__shopcart_set__user', 'ingredient').order_by().annotate(
+            amount=models.Sum('amount'))
+        return {(row['recipe__shopcart_set__user'], row['ingredient']):
+                row['amount'] for row in rows}
+
+
+class ShopListItem(models.Model):
+    """ Суммарное количество ингредиента в списке покупок пользователя. """
+
+    objects = ShopListItemQuerySet.as_manager()
+
+    user = models.ForeignKey(User, related_name='shop_list_items',
+                             on_delete=models.CASCADE)
+    ingredient = models.ForeignKey(Ingredient,
+                                   related_name='shop_list_items',
+                                   on_delete=models.CASCADE)
+    amount = models.PositiveIntegerField('Количество')
+
+    class Meta:
+        verbose_name = 'Позиция списка покупок'
+        verbose_name_plural = 'Позиции списков покупок'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'ingredient'),
+                name='unique_shop_list_item'),)
+
+    def __str__(self):
+        return f'{self.ingredient} {self.amount} для {self.user}'
+
+
+class ShoppingListExportQuerySet(models.QuerySet):
+
+    def older_than(self, seconds):
+        return self.filter(
+            created__lt=timezone.now() - timedelta(seconds=seconds))
+
+    def fail_stale(self, timeout):
+        """
+        Задания в очереди дольше timeout секунд помечаются ошибочными:
+        их поток не дожил до конца выгрузки, например при перезапуске.
+        """
+        return self.filter(
+            status=ShoppingListExport.Status.PENDING).older_than(
+            timeout).update(status=ShoppingListExport.Status.FAILED)
+
+
+class ShoppingListExport(models.Model):
+    """ Задание на фоновую выгрузку списка покупок в файл. """
+
+    class Status(models.TextChoices):
+        PENDING = 'pending', 'В очереди'
+        DONE = 'done', 'Готово'
+        FAILED = 'failed', 'Ошибка'
+
+    id = models.UUIDField(primary_key=True, default=uuid4, editable=False)
+    user = models.ForeignKey(User, related_name='shopping_list_exports',
+                             on_delete=models.CASCADE)
+    format = models.CharField('Формат',
+                              max_length=MAX_EXPORT_FORMAT_CHARACTERS)
+    status = models.CharField('Статус',
+                              max_length=MAX_EXPORT_STATUS_CHARACTERS,
+                              choices=Status.choices, default=Status.PENDING)
+    file = models.FileField('Файл', upload_to='shopping_lists/',
+                            null=True, default=None)
+    created = models.DateTimeField('Дата создания', auto_now_add=True)
+
+    objects = ShoppingListExportQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Выгрузка списка покупок'
+        verbose_name_plural = 'Выгрузки списков покупок'
+        ordering = ('-created',)
+
+    def __str__(self):
+        return f'{self.user} {self.format} {self.status}'
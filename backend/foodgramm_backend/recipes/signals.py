@@ -0,0 +1,101 @@
+from contextlib import contextmanager
+from threading import local
+
+from django.db.models.signals import (post_delete, post_save, pre_delete,
+                                      pre_save)
+from django.dispatch import receiver
+
+from .models import IngredientRecipe, Recipe, ShopCart, ShopListItem
+
+_state = local()
+
+
+def _synced_recipes():
+    if not hasattr(_state, 'recipes'):
+        _state.recipes = set()
+    return _state.recipes
+
+
+@contextmanager
+def shop_lists_synced(recipe_id):
+    """
+    Списки покупок по рецепту внутри блока обновляет вызывающий код,
+    сигналы строк рецепта и корзин их не трогают.
+    """
+    recipes = _synced_recipes()
+    added = recipe_id not in recipes
+    recipes.add(recipe_id)
+    try:
+        yield
+    finally:
+        if added:
+            recipes.discard(recipe_id)
+
+
+@receiver(pre_save, sender=ShopCart)
+@receiver(pre_save, sender=IngredientRecipe)
+def remember_previous(sender, instance, raw=False, **kwargs):
+    instance._previous = None
+    if not raw and not instance._state.adding:
+        instance._previous = sender.objects.filter(pk=instance.pk).first()
+
+
+@receiver(post_save, sender=ShopCart)
+def shop_cart_saved(instance, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_previous', None)
+    if previous is not None:
+        if ((previous.user_id, previous.recipe_id)
+                == (instance.user_id, instance.recipe_id)):
+            return
+        ShopListItem.objects.remove_recipe(previous.user_id,
+                                           previous.recipe_id)
+    ShopListItem.objects.add_recipe(instance.user_id, instance.recipe_id)
+
+
+@receiver(post_delete, sender=ShopCart)
+def shop_cart_deleted(instance, **kwargs):
+    if instance.recipe_id not in _synced_recipes():
+        ShopListItem.objects.remove_recipe(instance.user_id,
+                                           instance.recipe_id)
+
+
+@receiver(post_save, sender=IngredientRecipe)
+def ingredient_recipe_saved(instance, raw=False, **kwargs):
+    if raw or instance.recipe_id in _synced_recipes():
+        return
+    old_amounts = {}
+    previous = getattr(instance, '_previous', None)
+    if previous is not None and previous.recipe_id != instance.recipe_id:
+        ShopListItem.objects.change_recipe(
+            previous.recipe_id, {previous.ingredient_id: previous.amount}, {})
+    elif previous is not None:
+        old_amounts = {previous.ingredient_id: previous.amount}
+    ShopListItem.objects.change_recipe(
+        instance.recipe_id, old_amounts,
+        {instance.ingredient_id: instance.amount})
+
+
+@receiver(post_delete, sender=IngredientRecipe)
+def ingredient_recipe_deleted(instance, **kwargs):
+    if instance.recipe_id not in _synced_recipes():
+        ShopListItem.objects.change_recipe(
+            instance.recipe_id, {instance.ingredient_id: instance.amount}, {})
+
+
+@receiver(pre_delete, sender=Recipe)
+def recipe_deleting(instance, **kwargs):
+    """
+    Рецепт вычитается из списков покупок целиком до каскадного удаления,
+    удаление его строк и корзин списки уже не меняет.
+    """
+    ShopListItem.objects.change_recipe(
+        instance, dict(instance.ingredientrecipe.values_list(
+            'ingredient_id', 'amount')), {})
+    _synced_recipes().add(instance.pk)
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(instance, **kwargs):
+    _synced_recipes().discard(instance.pk)